@@ -7,6 +7,12 @@ import subprocess
 import os
 import sys
 import json
+import threading
+import hashlib
+import gzip
+import random
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
 
 # 尝试导入tkinter，如果失败则提供提示
 try:
@@ -21,7 +27,36 @@ except ImportError:
 
 # --- 配置 ---
 SERVER_URL = "http://10.32.3.24"
+# 服务器未给出间隔建议 (旧版服务器或请求失败) 时的心跳间隔；
+# 新版服务器在心跳响应中返回 next_poll_seconds，空闲时放慢到几分钟，管理员操作时缩短到几秒
+# (长轮询心跳不使用该间隔，返回后立即发起下一次长轮询)
 POLL_INTERVAL_SECONDS = 20
+MAX_POLL_INTERVAL_SECONDS = 600
+# 长轮询：服务器在没有任务时会挂起心跳请求直到有任务或超时，
+# 因此请求超时必须大于服务器端的 AGENT_LONG_POLL_TIMEOUT。
+LONG_POLL_ENABLED = True
+LONG_POLL_REQUEST_TIMEOUT = 60
+# 同时执行的任务数上限；心跳只领取空闲槽位数量的任务 (服务器端另有单次上限)
+MAX_CONCURRENT_JOBS = 2
+# 脚本运行期间向服务器推送输出的间隔 (秒) 和单块最大字符数
+OUTPUT_FLUSH_INTERVAL_SECONDS = 2
+OUTPUT_CHUNK_MAX_CHARS = 64 * 1024
+JOB_TIMEOUT_SECONDS = 300
+# 本地脚本缓存最多保留的文件数 (按最近使用时间淘汰)
+SCRIPT_CACHE_MAX_FILES = 200
+
+# 本地账户同步：按该间隔重新采集本机账户，心跳只携带摘要，服务器需要时再上传完整列表
+ACCOUNT_SYNC_ENABLED = True
+ACCOUNT_SNAPSHOT_INTERVAL_SECONDS = 3600
+
+# 结果上报：每个请求最多携带的结果条数和 (未压缩的) 字节数
+RESULT_UPLOAD_MAX_ITEMS = 50
+RESULT_UPLOAD_MAX_BYTES = 4 * 1024 * 1024
+
+# 传输层：超过该大小的请求体使用 gzip 压缩；连续失败后按指数退避 (带随机抖动) 重试
+GZIP_MIN_BYTES = 1024
+BACKOFF_BASE_SECONDS = 10
+BACKOFF_MAX_SECONDS = 300
 
 # --- 路径设置 ---
 if getattr(sys, 'frozen', False):
@@ -31,8 +66,10 @@ else:
     # 如果是直接运行 .py 脚本
     AGENT_DIR = os.path.dirname(os.path.abspath(__file__))
 
-SCRIPT_PATH = os.path.join(AGENT_DIR, 'temp_job_script.ps1')
+JOBS_DIR = os.path.join(AGENT_DIR, 'jobs') # 每个任务独立的临时脚本文件
+SCRIPT_CACHE_DIR = os.path.join(AGENT_DIR, 'script_cache') # 按内容哈希缓存的脚本
 CONFIG_FILE = os.path.join(AGENT_DIR, 'agent_config.json') # 配置文件，用于标记是否已设置
+RESULT_SPOOL_FILE = os.path.join(AGENT_DIR, 'result_spool.jsonl') # 待上报的任务结果 (追加写入)
 
 # --- 辅助函数 ---
 def get_hostname():
@@ -55,6 +92,56 @@ def get_all_ips():
         except Exception:
             return []
 
+# --- 传输层 ---
+class AgentTransport:
+    """与服务器通信：复用长连接会话、gzip 压缩请求体、失败后指数退避"""
+
+    def __init__(self, base_url):
+        self.base_url = base_url
+        self.session = requests.Session()
+        # 心跳线程和各任务线程共用一个会话，连接池大小需覆盖并发数
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=MAX_CONCURRENT_JOBS + 2)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.session.headers.update({'Accept-Encoding': 'gzip'})
+        self._lock = threading.Lock()
+        self._consecutive_failures = 0
+
+    def _record(self, success):
+        with self._lock:
+            self._consecutive_failures = 0 if success else self._consecutive_failures + 1
+
+    def backoff_delay(self):
+        """下一次重试前应等待的秒数 (full jitter)；没有失败时返回 None"""
+        with self._lock:
+            failures = self._consecutive_failures
+        if failures == 0:
+            return None
+        cap = min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** (failures - 1))
+        return random.uniform(0, cap)
+
+    def _send(self, method, path, timeout, **kwargs):
+        try:
+            response = self.session.request(method, f"{self.base_url}{path}", timeout=timeout, **kwargs)
+        except requests.exceptions.RequestException:
+            self._record(False)
+            raise
+        self._record(response.status_code < 500)
+        return response
+
+    def post(self, path, payload, timeout=20):
+        body = json.dumps(payload).encode('utf-8')
+        headers = {'Content-Type': 'application/json'}
+        if len(body) >= GZIP_MIN_BYTES:
+            body = gzip.compress(body)
+            headers['Content-Encoding'] = 'gzip'
+        return self._send('POST', path, timeout, data=body, headers=headers)
+
+    def get(self, path, timeout=20):
+        return self._send('GET', path, timeout)
+
+transport = AgentTransport(SERVER_URL)
+
 # --- 首次运行设置 ---
 def run_setup_gui():
     """使用 Tkinter 弹窗进行首次设置"""
@@ -78,7 +165,7 @@ def run_setup_gui():
     payload = {'system_name': system_name, 'hostname': hostname, 'ip_addresses': ip_string}
     
     try:
-        response = requests.post(f"{SERVER_URL}/api/agent/register_pending_system", json=payload, timeout=20)
+        response = transport.post("/api/agent/register_pending_system", payload)
         response.raise_for_status()
         result = response.json()
         if result.get('status') == 'success':
@@ -118,7 +205,7 @@ def run_setup_cli():
     payload = {'system_name': system_name, 'hostname': hostname, 'ip_addresses': ip_string}
     print("\n正在上传信息到服务器...")
     try:
-        response = requests.post(f"{SERVER_URL}/api/agent/register_pending_system", json=payload, timeout=20)
+        response = transport.post("/api/agent/register_pending_system", payload)
         response.raise_for_status()
         result = response.json()
         if result.get('status') == 'success':
@@ -134,53 +221,373 @@ def run_setup_cli():
         return False
 
 # --- 常规操作 ---
-def report_job_result(job_id, status, output):
-    """向服务器报告任务执行结果"""
+class ResultSpool:
+    """任务结果的本地追加日志。
+
+    结果先写入并落盘，再由上传函数批量提交；服务器确认后追加一条 ack 记录，
+    全部确认后截断文件。Agent 崩溃或网络中断后重启，未确认的结果会被重新上报。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def _write_line(self, record):
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record, ensure_ascii=False) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+
+    def append(self, result):
+        with self._lock:
+            self._write_line({'result': result})
+
+    def _read_pending(self):
+        pending = {}
+        if not os.path.exists(self.path):
+            return pending
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # 写到一半时断电留下的残行
+                    continue
+                if 'result' in record:
+                    pending[record['result']['job_id']] = record['result']
+                elif 'ack' in record:
+                    pending.pop(record['ack'], None)
+        return pending
+
+    def pending(self):
+        with self._lock:
+            return list(self._read_pending().values())
+
+    def ack(self, job_ids):
+        with self._lock:
+            for job_id in job_ids:
+                self._write_line({'ack': job_id})
+            if not self._read_pending():
+                # 全部确认后截断，避免日志无限增长
+                open(self.path, 'w').close()
+
+result_spool = ResultSpool(RESULT_SPOOL_FILE)
+_upload_lock = threading.Lock()
+
+def upload_spooled_results():
+    """把本地未确认的结果分批提交到服务器，返回是否已全部上报"""
+    with _upload_lock:
+        pending = result_spool.pending()
+        while pending:
+            batch, size = [], 0
+            while pending and len(batch) < RESULT_UPLOAD_MAX_ITEMS:
+                item_size = len(pending[0].get('output') or '')
+                if batch and size + item_size > RESULT_UPLOAD_MAX_BYTES:
+                    break
+                batch.append(pending.pop(0))
+                size += item_size
+            try:
+                response = transport.post("/api/agent/report_job_results",
+                                          {'hostname': get_hostname(), 'results': batch})
+                response.raise_for_status()
+                body = response.json()
+                outcomes = body.get('results', {})
+                rejected = set(body.get('rejected') or [])
+            except Exception as e:
+                print(f"Error reporting job results, will retry later: {e}")
+                return False
+            # 服务器对每条结果都给出了处理结论 (包括任务不存在、已完成、格式错误被拒绝等)，均视为已送达；
+            # 被拒绝的条目重传也不会成功，直接从结果日志中丢弃
+            for index, item in enumerate(batch):
+                if index in rejected:
+                    print(f"Server rejected malformed result for job {item['job_id']!r}, dropping it.")
+            result_spool.ack([item['job_id'] for index, item in enumerate(batch)
+                              if index in rejected or str(item['job_id']) in outcomes])
+            print(f"Reported {len(batch)} job result(s).")
+        return True
+
+def report_job_result(job_id, status, output=None):
+    """记录任务执行结果并尝试上报。output 为 None 表示输出已通过分块接口上报"""
     print(f"Reporting result for job {job_id}...")
-    payload = {'job_id': job_id, 'status': status, 'output': output}
+    result = {'job_id': job_id, 'status': status}
+    if output is not None:
+        result['output'] = output
+    result_spool.append(result)
+    upload_spooled_results()
+
+class JobOutputStream:
+    """收集脚本输出，并按 offset 分块增量推送到服务器"""
+
+    def __init__(self, job_id):
+        self.job_id = job_id
+        self._parts = []
+        self._lock = threading.Lock()
+        self.sent_offset = 0
+
+    def write(self, text):
+        with self._lock:
+            self._parts.append(text)
+
+    def getvalue(self):
+        with self._lock:
+            return ''.join(self._parts)
+
+    def flush(self):
+        """把尚未上报的输出发送给服务器，全部送达返回 True"""
+        text = self.getvalue()
+        while self.sent_offset < len(text):
+            chunk = text[self.sent_offset:self.sent_offset + OUTPUT_CHUNK_MAX_CHARS]
+            payload = {'job_id': self.job_id, 'offset': self.sent_offset, 'data': chunk, 'hostname': get_hostname()}
+            try:
+                response = transport.post("/api/agent/append_job_output", payload)
+                if response.status_code == 409 and 'offset' in response.json():
+                    # 服务器端与本地不一致，从服务器当前位置重发
+                    self.sent_offset = response.json()['offset']
+                    continue
+                response.raise_for_status()
+                self.sent_offset = response.json()['offset']
+            except Exception as e:
+                print(f"Error streaming output for job {self.job_id}: {e}")
+                return False
+        return True
+
+def _content_hash(content):
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+def _prune_script_cache():
+    """缓存文件过多时删除最久未使用的脚本"""
     try:
-        requests.post(f"{SERVER_URL}/api/agent/report_job_result", json=payload, timeout=20)
-        print("Job result reported successfully.")
-    except Exception as e:
-        print(f"Error reporting job result: {e}")
+        files = [os.path.join(SCRIPT_CACHE_DIR, name) for name in os.listdir(SCRIPT_CACHE_DIR)]
+        files.sort(key=os.path.getmtime, reverse=True)
+        for path in files[SCRIPT_CACHE_MAX_FILES:]:
+            os.remove(path)
+    except OSError as e:
+        print(f"Error pruning script cache: {e}")
+
+def get_script_content(script_hash):
+    """按内容哈希从本地缓存读取脚本，未命中时从服务器下载并校验"""
+    cache_path = os.path.join(SCRIPT_CACHE_DIR, f"{script_hash}.ps1")
+    if os.path.exists(cache_path):
+        with open(cache_path, 'r', encoding='utf-8', newline='') as f:
+            content = f.read()
+        if _content_hash(content) == script_hash:
+            os.utime(cache_path)
+            return content
+        print(f"Cached script {script_hash} is corrupted, downloading again.")
+
+    print(f"Script cache miss, downloading {script_hash}...")
+    response = transport.get(f"/api/agent/script/{script_hash}")
+    response.raise_for_status()
+    content = response.json()['script_content']
+    if _content_hash(content) != script_hash:
+        raise ValueError(f"Downloaded script does not match hash {script_hash}")
+
+    os.makedirs(SCRIPT_CACHE_DIR, exist_ok=True)
+    temp_path = cache_path + '.tmp'
+    with open(temp_path, 'w', encoding='utf-8', newline='') as f:
+        f.write(content)
+    os.replace(temp_path, cache_path)
+    _prune_script_cache()
+    return content
+
+def _pump_pipe(pipe, sink):
+    """在后台线程中逐行读取子进程输出"""
+    for line in iter(pipe.readline, ''):
+        sink(line)
+    pipe.close()
 
-def execute_job(job_id, script_content):
-    """执行从服务器获取的 PowerShell 脚本"""
+def execute_job(job_id, script_content=None, script_hash=None):
+    """执行从服务器获取的 PowerShell 脚本，运行期间持续上报输出"""
     print(f"Executing job {job_id}...")
+    stream = JobOutputStream(job_id)
+    stderr_lines = []
+    script_path = os.path.join(JOBS_DIR, f"job_{job_id}.ps1")
     try:
-        with open(SCRIPT_PATH, 'w', encoding='utf-8-sig') as f:
+        if script_content is None:
+            script_content = get_script_content(script_hash)
+        os.makedirs(JOBS_DIR, exist_ok=True)
+        with open(script_path, 'w', encoding='utf-8-sig') as f:
             f.write(script_content)
         
-        command = ['powershell.exe', '-ExecutionPolicy', 'Bypass', '-File', SCRIPT_PATH]
-        result = subprocess.run(command, capture_output=True, text=True, encoding='utf-8', errors='ignore', timeout=300)
+        command = ['powershell.exe', '-ExecutionPolicy', 'Bypass', '-File', script_path]
+        process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                   text=True, encoding='utf-8', errors='ignore')
+        readers = [threading.Thread(target=_pump_pipe, args=(process.stdout, stream.write), daemon=True),
+                   threading.Thread(target=_pump_pipe, args=(process.stderr, stderr_lines.append), daemon=True)]
+        for reader in readers:
+            reader.start()
 
-        status = 'completed' if result.returncode == 0 else 'failed'
-        output = result.stdout if status == 'completed' else f"STDOUT:\n{result.stdout}\n\nSTDERR:\n{result.stderr}"
-        report_job_result(job_id, status, output)
+        deadline = time.monotonic() + JOB_TIMEOUT_SECONDS
+        timed_out = False
+        while True:
+            try:
+                process.wait(timeout=OUTPUT_FLUSH_INTERVAL_SECONDS)
+                break
+            except subprocess.TimeoutExpired:
+                if time.monotonic() >= deadline:
+                    process.kill()
+                    process.wait()
+                    timed_out = True
+                    break
+                stream.flush()
+        for reader in readers:
+            reader.join(timeout=5)
+
+        if timed_out:
+            print(f"Job {job_id} timed out.")
+            stream.write(f"\n\nExecution timed out after {JOB_TIMEOUT_SECONDS // 60} minutes.")
+            status = 'failed'
+        else:
+            status = 'completed' if process.returncode == 0 else 'failed'
+        if status == 'failed' and stderr_lines:
+            stream.write("\n\nSTDERR:\n" + ''.join(stderr_lines))
+
+        # 分块上报失败时退回一次性上报完整输出
+        if stream.flush():
+            report_job_result(job_id, status)
+        else:
+            report_job_result(job_id, status, stream.getvalue())
 
-    except subprocess.TimeoutExpired:
-        print(f"Job {job_id} timed out.")
-        report_job_result(job_id, 'failed', 'Execution timed out after 5 minutes.')
     except Exception as e:
         print(f"An error occurred while executing job {job_id}: {e}")
-        report_job_result(job_id, 'failed', str(e))
+        report_job_result(job_id, 'failed', stream.getvalue() + str(e))
     finally:
-        if os.path.exists(SCRIPT_PATH):
-            os.remove(SCRIPT_PATH)
+        if os.path.exists(script_path):
+            os.remove(script_path)
+
+# --- 本地账户 ---
+LOCAL_ACCOUNTS_SCRIPT = r"""
+[Console]::OutputEncoding = [System.Text.Encoding]::UTF8
+$membership = @{}
+foreach ($group in Get-LocalGroup) {
+    foreach ($member in (Get-LocalGroupMember -Group $group -ErrorAction SilentlyContinue)) {
+        if ($member.PrincipalSource -eq 'Local') {
+            $name = $member.Name.Split('\')[-1]
+            $membership[$name] = @($membership[$name]) + $group.Name
+        }
+    }
+}
+@(Get-LocalUser | ForEach-Object {
+    [pscustomobject]@{
+        username  = $_.Name
+        full_name = $_.FullName
+        enabled   = [bool]$_.Enabled
+        groups    = @($membership[$_.Name] | Where-Object { $_ })
+    }
+}) | ConvertTo-Json -Compress -Depth 3
+"""
+
+class LocalAccountSnapshot:
+    """定期采集本机账户及所属组，计算稳定的摘要"""
 
-def heartbeat_and_get_job():
-    """发送心跳并检查是否有待处理任务"""
+    def __init__(self):
+        self.accounts = None
+        self.digest = None
+        self._collected_at = None
+
+    def refresh_if_due(self):
+        if not ACCOUNT_SYNC_ENABLED:
+            return
+        if self._collected_at is not None and time.monotonic() - self._collected_at < ACCOUNT_SNAPSHOT_INTERVAL_SECONDS:
+            return
+        self._collected_at = time.monotonic()
+        try:
+            result = subprocess.run(['powershell.exe', '-NoProfile', '-NonInteractive', '-Command', LOCAL_ACCOUNTS_SCRIPT],
+                                    capture_output=True, text=True, encoding='utf-8', errors='ignore', timeout=120)
+            accounts = json.loads(result.stdout or '[]')
+        except Exception as e:
+            print(f"Error collecting local accounts: {e}")
+            return
+        if isinstance(accounts, dict):
+            accounts = [accounts]
+        for account in accounts:
+            account['groups'] = sorted(account.get('groups') or [])
+        self.accounts = sorted(accounts, key=lambda a: a.get('username', '').lower())
+        canonical = json.dumps(self.accounts, sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+        self.digest = hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+    def upload(self):
+        """上传完整列表 (服务器在心跳中返回 send_accounts 时调用)"""
+        if self.accounts is None:
+            return
+        payload = {'hostname': get_hostname(), 'digest': self.digest, 'accounts': self.accounts}
+        try:
+            response = transport.post("/api/agent/accounts", payload)
+            response.raise_for_status()
+            print(f"Local accounts synced: {response.json().get('changes')}")
+        except Exception as e:
+            print(f"Error uploading local accounts: {e}")
+
+local_accounts = LocalAccountSnapshot()
+
+class JobRunner:
+    """有界的任务执行池，任务在后台线程中运行，不阻塞心跳"""
+
+    def __init__(self, max_workers):
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='job')
+        self._lock = threading.Lock()
+        self._active_job_ids = set()
+        self.slot_freed = threading.Event()
+
+    def free_slots(self):
+        with self._lock:
+            return self.max_workers - len(self._active_job_ids)
+
+    def submit(self, job):
+        with self._lock:
+            if job['job_id'] in self._active_job_ids:
+                return
+            self._active_job_ids.add(job['job_id'])
+        self._executor.submit(self._run, job)
+
+    def _run(self, job):
+        try:
+            execute_job(job['job_id'], job.get('script_content'), job.get('script_hash'))
+        finally:
+            with self._lock:
+                self._active_job_ids.discard(job['job_id'])
+            self.slot_freed.set()
+
+def heartbeat_and_get_job(runner):
+    """发送心跳并把领取到的任务交给执行池。
+    返回距离下一次心跳还应等待的秒数 (0 表示立即发起下一次心跳)。"""
     print("Sending heartbeat and checking for jobs...")
+    started = time.monotonic()
     try:
-        payload = {'hostname': get_hostname()}
-        response = requests.post(f"{SERVER_URL}/api/agent/heartbeat", json=payload, timeout=15)
+        # 先清除标记再计算空闲槽位，之后有任务结束时主循环能立即再次心跳
+        runner.slot_freed.clear()
+        payload = {'hostname': get_hostname(), 'wait': LONG_POLL_ENABLED, 'max_jobs': runner.free_slots(),
+                   'script_cache': True}
+        if local_accounts.digest:
+            payload['accounts_digest'] = local_accounts.digest
+        timeout = LONG_POLL_REQUEST_TIMEOUT if LONG_POLL_ENABLED else 15
+        response = transport.post("/api/agent/heartbeat", payload, timeout=timeout)
         response.raise_for_status()
         data = response.json()
         
-        if data.get('job_id'):
-            execute_job(data['job_id'], data['script_content'])
+        # 旧版服务器只返回顶层的单个任务
+        jobs = data.get('jobs')
+        if jobs is None and data.get('job_id'):
+            jobs = [{'job_id': data['job_id'], 'script_content': data['script_content']}]
+        if jobs:
+            for job in jobs:
+                runner.submit(job)
         else:
             print("No pending jobs found.")
+        if data.get('send_accounts'):
+            local_accounts.upload()
+
+        if data.get('long_poll'):
+            # 长轮询已在服务器端挂起等待，立即发起下一次长轮询，否则新任务要等到睡醒才能领取
+            return 0
+        hint = data.get('next_poll_seconds')
+        if hint is None:
+            # 旧版服务器不认识 wait 参数，会立即返回且不带 long_poll 标记，此时退回定时轮询
+            return POLL_INTERVAL_SECONDS
+        # 间隔从本次心跳发出时算起，长轮询挂起的时间已经计入
+        hint = min(max(float(hint), 0.0), MAX_POLL_INTERVAL_SECONDS)
+        return max(0.0, hint - (time.monotonic() - started))
             
     except requests.exceptions.ConnectionError:
         print(f"Connection to server {SERVER_URL} failed.")
@@ -188,14 +595,30 @@ def heartbeat_and_get_job():
         print(f"An error occurred while communicating with the server: {e}")
     except Exception as e:
         print(f"An unexpected error occurred during heartbeat: {e}")
+    return POLL_INTERVAL_SECONDS
 
 def run_normal_operation():
     """常规的轮询和任务执行模式"""
     print(f"Agent starting up in normal mode...")
+    runner = JobRunner(MAX_CONCURRENT_JOBS)
     while True:
-        heartbeat_and_get_job()
-        print(f"Sleeping for {POLL_INTERVAL_SECONDS} seconds...")
-        time.sleep(POLL_INTERVAL_SECONDS)
+        # 先补报之前因网络故障积压的结果
+        if result_spool.pending():
+            upload_spooled_results()
+        local_accounts.refresh_if_due()
+        delay = heartbeat_and_get_job(runner)
+        if delay <= 0 and runner.free_slots() > 0:
+            continue
+        backoff = transport.backoff_delay()
+        if backoff is not None:
+            # 服务器不可用：退避时间随连续失败次数指数增长并随机抖动，避免服务器重启后所有 Agent 同时重连
+            print(f"Server unavailable, retrying in {backoff:.1f} seconds...")
+            time.sleep(backoff)
+            continue
+        # 按服务器建议的间隔等待 (槽位已满时至少等待默认间隔)，有任务结束则提前醒来
+        delay = delay if delay > 0 else POLL_INTERVAL_SECONDS
+        print(f"Sleeping for up to {delay:.0f} seconds...")
+        runner.slot_freed.wait(delay)
 
 # --- 主入口 ---
 if __name__ == "__main__":
@@ -62,4 +62,8 @@ def create_app(config_class=Config):
 
     from app.cli import register as register_cli
     register_cli(app)
+
+    if app.config.get('SCHEDULER_ENABLED'):
+        from app.scheduler import scheduler
+        scheduler.ensure_started(app)
     return app
\ No newline at end of file
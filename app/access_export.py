@@ -0,0 +1,195 @@
+# app/access_export.py
+"""
+系统账户及权限的流式导出 (CSV / XLSX)，供季度审计使用。
+
+数据直接读访问矩阵 (app.access_matrix)，查询使用服务器端游标
+(stream_results + yield_per)，逐批取行并立即编码输出，内存占用与导出行数无关：
+  - CSV：带 UTF-8 BOM (Excel 直接打开不乱码)，每攒够一批行就输出一块；
+  - XLSX：用 zipfile 边写边输出一个最小的 xlsx 包，单元格使用内联字符串，
+    不需要在内存中维护共享字符串表 (openpyxl 的 write_only 模式仍会为所有
+    不同的字符串维护共享字符串表，且 20 万行需要十几秒)。
+"""
+import csv
+import io
+import re
+import zipfile
+from datetime import datetime
+from urllib.parse import quote
+from xml.sax.saxutils import escape
+
+EXPORT_HEADERS = ('中文名', '用户名', '系统编号', '系统名称', '分组', '用户类型', '角色', '状态')
+LINK_TYPE_LABELS = {'computer': '电脑用户', 'workstation': '工作站用户'}
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+
+
+def export_rows(group_id=None, system_id=None, include_inactive=False, batch_size=1000):
+    """按 (中文名, 用户名, 系统编号) 顺序逐行产出导出数据 (生成器)"""
+    from app import db
+    from app.models import AccessMatrix, Group
+
+    query = (db.session.query(AccessMatrix.chinese_name, AccessMatrix.username, AccessMatrix.system_number,
+                              AccessMatrix.system_name, Group.name, AccessMatrix.link_type, AccessMatrix.role,
+                              AccessMatrix.is_active)
+             .outerjoin(Group, Group.id == AccessMatrix.group_id))
+    if group_id:
+        query = query.filter(AccessMatrix.group_id == group_id)
+    if system_id:
+        query = query.filter(AccessMatrix.system_id == system_id)
+    if not include_inactive:
+        query = query.filter(AccessMatrix.is_active.is_(True))
+    query = (query.order_by(AccessMatrix.chinese_name, AccessMatrix.username, AccessMatrix.system_number,
+                            AccessMatrix.link_type, AccessMatrix.link_id)
+             .execution_options(stream_results=True).yield_per(batch_size))
+    for chinese_name, username, system_number, system_name, group_name, link_type, role, is_active in query:
+        yield (chinese_name, username, system_number, system_name, group_name or '未分组',
+               LINK_TYPE_LABELS.get(link_type, link_type), role or '', '启用' if is_active else '停用')
+
+
+# 以这些字符开头的单元格会被 Excel 当作公式 (用户名等可能来自 Agent 上报的数据)
+_FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+
+def _csv_safe(value):
+    if isinstance(value, str) and value.startswith(_FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def iter_csv(rows, flush_rows=500):
+    """把行序列编码为 CSV 字节块 (开头带 BOM，可能被当作公式的单元格前加单引号)"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    buffer.write('\ufeff')
+    writer.writerow(EXPORT_HEADERS)
+    for count, row in enumerate(rows, 1):
+        writer.writerow([_csv_safe(value) for value in row])
+        if count % flush_rows == 0:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode('utf-8')
+
+
+# --- 最小 XLSX 包 ---
+_XLSX_STATIC_PARTS = {
+    '[Content_Types].xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '<Override PartName="/xl/styles.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+        '</Types>'),
+    '_rels/.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+        'Target="xl/workbook.xml"/>'
+        '</Relationships>'),
+    'xl/_rels/workbook.xml.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+        'Target="worksheets/sheet1.xml"/>'
+        '<Relationship Id="rId2" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" '
+        'Target="styles.xml"/>'
+        '</Relationships>'),
+    'xl/styles.xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+        '<fonts count="1"><font><sz val="11"/><name val="Calibri"/></font></fonts>'
+        '<fills count="1"><fill><patternFill patternType="none"/></fill></fills>'
+        '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+        '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+        '<cellXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/></cellXfs>'
+        '<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>'
+        '</styleSheet>'),
+}
+_WORKBOOK_XML = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+    '<sheets><sheet name="{title}" sheetId="1" r:id="rId1"/></sheets></workbook>')
+_SHEET_HEAD = ('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+               '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>')
+_SHEET_TAIL = '</sheetData></worksheet>'
+# XML 1.0 不允许的控制字符
+_ILLEGAL_XML_CHARS = re.compile(r'[\x00-\x08\x0b\x0c\x0e-\x1f]')
+# 工作表名称不允许的字符
+_ILLEGAL_SHEET_CHARS = re.compile(r'[\\/?*\[\]:]')
+
+
+class _ChunkSink(io.RawIOBase):
+    """不可 seek 的输出流：收集 zipfile 写出的字节，由生成器逐块取走"""
+
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+        self.size = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self.size += len(data)
+        return len(data)
+
+    def take(self):
+        data = b''.join(self._chunks)
+        self._chunks, self.size = [], 0
+        return data
+
+
+def _column_letter(index):
+    letters = ''
+    index += 1
+    while index:
+        index, remainder = divmod(index - 1, 26)
+        letters = chr(65 + remainder) + letters
+    return letters
+
+
+def _xlsx_row(number, values, columns):
+    cells = ''.join(
+        f'<c r="{column}{number}" t="inlineStr"><is><t xml:space="preserve">'
+        f'{escape(_ILLEGAL_XML_CHARS.sub("", "" if value is None else str(value)))}</t></is></c>'
+        for column, value in zip(columns, values))
+    return f'<row r="{number}">{cells}</row>'
+
+
+def iter_xlsx(rows, sheet_title='系统用户', flush_rows=500, chunk_size=64 * 1024):
+    """把行序列编码为 XLSX，边压缩边产出字节块"""
+    sink = _ChunkSink()
+    title = escape(_ILLEGAL_SHEET_CHARS.sub('', sheet_title)[:31] or 'Sheet1', {'"': '&quot;'})
+    columns = [_column_letter(index) for index in range(len(EXPORT_HEADERS))]
+    with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_DEFLATED) as package:
+        for name, content in _XLSX_STATIC_PARTS.items():
+            package.writestr(name, content)
+        package.writestr('xl/workbook.xml', _WORKBOOK_XML.format(title=title))
+        with package.open('xl/worksheets/sheet1.xml', 'w') as sheet:
+            buffer = [_SHEET_HEAD, _xlsx_row(1, EXPORT_HEADERS, columns)]
+            for number, row in enumerate(rows, 2):
+                buffer.append(_xlsx_row(number, row, columns))
+                if len(buffer) >= flush_rows:
+                    sheet.write(''.join(buffer).encode('utf-8'))
+                    buffer = []
+                    if sink.size >= chunk_size:
+                        yield sink.take()
+            buffer.append(_SHEET_TAIL)
+            sheet.write(''.join(buffer).encode('utf-8'))
+    yield sink.take()
+
+
+def export_filename(prefix, export_format):
+    """Content-Disposition 头：ASCII 文件名 + UTF-8 编码的完整文件名 (RFC 5987)"""
+    filename = f"{prefix}_{datetime.now():%Y%m%d_%H%M}.{export_format}"
+    fallback = filename.encode('ascii', 'ignore').decode('ascii') or f'export.{export_format}'
+    return f"attachment; filename=\"{fallback}\"; filename*=UTF-8''{quote(filename)}"
@@ -0,0 +1,180 @@
+# app/access_matrix.py
+"""
+人员 × 系统的访问矩阵 (access_matrix 表)。
+
+每条电脑用户链接 (SystemUser) / 工作站用户链接 (WorkstationUser) 对应矩阵中的一行，
+冗余保存人员 (中文名、用户名)、系统 (编号、名称、分组)、角色和是否启用。
+用户目录、人员权限列表、系统用户列表都直接读这张表，不再逐条加载链接、系统和角色。
+
+矩阵随事务增量维护：
+  - 通过 ORM 新增/修改/删除链接，修改账户姓名或系统名称/编号/分组时，
+    映射器事件自动记下受影响的链接、账户或系统；
+  - 绕过 ORM 的批量 UPDATE (query.update) 需要调用方用 mark_links_changed /
+    mark_accounts_changed 登记；
+  - 事务提交前 (before_commit) 对登记的范围执行“删除旧行 + INSERT ... SELECT”，
+    与业务修改在同一个事务中生效，回滚时一起撤销。
+flask rebuild-access-matrix 可全量重建。
+"""
+from sqlalchemy import event, inspect, literal, select
+from sqlalchemy.orm import Session
+
+# 每条 IN 语句的最大 id 数
+CHUNK_SIZE = 500
+
+_PENDING_KEY = 'access_matrix_changes'
+# 登记范围：(范围类型, id)，范围类型为 'account' / 'system' / 'computer' / 'workstation'
+SCOPES = ('account', 'system', 'computer', 'workstation')
+
+
+def _pending(session):
+    return session.info.setdefault(_PENDING_KEY, {scope: set() for scope in SCOPES})
+
+
+def mark_links_changed(link_type, link_ids, session=None):
+    """登记批量修改过的链接 ('computer' 或 'workstation')，提交时刷新对应矩阵行"""
+    from app import db
+
+    _pending(session or db.session)[link_type].update(link_ids)
+
+
+def mark_accounts_changed(account_ids, session=None):
+    """登记权限被批量修改的账户，提交时刷新这些账户的全部矩阵行"""
+    from app import db
+
+    _pending(session or db.session)['account'].update(account_ids)
+
+
+def _link_selects():
+    """电脑用户和工作站用户链接对应的矩阵行 (列顺序与 MATRIX_COLUMNS 一致)"""
+    from app.models import SystemAccount, System, SystemUser, WorkstationUser, SystemRole
+
+    computer = (select(literal('computer'), SystemUser.id, SystemUser.account_id, SystemAccount.chinese_name,
+                       SystemAccount.username, SystemUser.system_id, System.system_number, System.name,
+                       System.group_id, SystemUser.system_role, SystemUser.is_active)
+                .join(SystemAccount, SystemAccount.id == SystemUser.account_id)
+                .join(System, System.id == SystemUser.system_id))
+    workstation = (select(literal('workstation'), WorkstationUser.id, WorkstationUser.account_id,
+                          SystemAccount.chinese_name, SystemAccount.username, WorkstationUser.system_id,
+                          System.system_number, System.name, System.group_id, SystemRole.name,
+                          WorkstationUser.is_active)
+                   .join(SystemAccount, SystemAccount.id == WorkstationUser.account_id)
+                   .join(System, System.id == WorkstationUser.system_id)
+                   .join(SystemRole, SystemRole.id == WorkstationUser.role_id))
+    return (('computer', SystemUser, computer), ('workstation', WorkstationUser, workstation))
+
+
+MATRIX_COLUMNS = ('link_type', 'link_id', 'account_id', 'chinese_name', 'username', 'system_id',
+                  'system_number', 'system_name', 'group_id', 'role', 'is_active')
+
+
+def _refresh(session, scope, ids):
+    """重新生成某个范围内的矩阵行"""
+    from app.models import AccessMatrix
+
+    table = AccessMatrix.__table__
+    columns = [table.c[name] for name in MATRIX_COLUMNS]
+    ids = sorted(ids)
+    for start in range(0, len(ids), CHUNK_SIZE):
+        chunk = ids[start:start + CHUNK_SIZE]
+        if scope in ('computer', 'workstation'):
+            session.execute(table.delete().where(table.c.link_type == scope, table.c.link_id.in_(chunk)))
+        else:
+            session.execute(table.delete().where(table.c[f'{scope}_id'].in_(chunk)))
+        for link_type, model, statement in _link_selects():
+            if scope in ('computer', 'workstation'):
+                if scope != link_type:
+                    continue
+                statement = statement.where(model.id.in_(chunk))
+            else:
+                statement = statement.where(getattr(model, f'{scope}_id').in_(chunk))
+            session.execute(table.insert().from_select(columns, statement))
+
+
+def apply_pending(session):
+    """刷新本事务登记过的全部范围，返回刷新的 id 数"""
+    session.flush()
+    pending = session.info.pop(_PENDING_KEY, None)
+    if not pending:
+        return 0
+    refreshed = 0
+    # 账户和系统范围已覆盖其下的链接，不必再单独刷新
+    for scope in SCOPES:
+        ids = pending[scope]
+        if scope in ('computer', 'workstation') and ids:
+            ids = _uncovered_links(session, scope, ids, pending['account'], pending['system'])
+        if ids:
+            _refresh(session, scope, ids)
+            refreshed += len(ids)
+    return refreshed
+
+
+def _uncovered_links(session, link_type, link_ids, account_ids, system_ids):
+    if not account_ids and not system_ids:
+        return link_ids
+    from app.models import SystemUser, WorkstationUser
+
+    model = SystemUser if link_type == 'computer' else WorkstationUser
+    covered = set()
+    ids = sorted(link_ids)
+    for start in range(0, len(ids), CHUNK_SIZE):
+        rows = (session.query(model.id, model.account_id, model.system_id)
+                .filter(model.id.in_(ids[start:start + CHUNK_SIZE])).all())
+        covered.update(link_id for link_id, account_id, system_id in rows
+                       if account_id in account_ids or system_id in system_ids)
+    return set(link_ids) - covered
+
+
+def rebuild_access_matrix(session=None):
+    """全量重建矩阵 (不提交)，返回写入的行数"""
+    from app import db
+    from app.models import AccessMatrix
+
+    session = session or db.session
+    table = AccessMatrix.__table__
+    columns = [table.c[name] for name in MATRIX_COLUMNS]
+    session.info.pop(_PENDING_KEY, None)
+    session.execute(table.delete())
+    for _, _, statement in _link_selects():
+        session.execute(table.insert().from_select(columns, statement))
+    return session.query(AccessMatrix).count()
+
+
+# --- 随事务增量维护 ---
+def _changed(target, *attributes):
+    state = inspect(target)
+    return any(state.attrs[name].history.has_changes() for name in attributes if name in state.attrs)
+
+
+def track_access_changes(account_model, system_model, computer_model, workstation_model):
+    """注册相关模型的写入事件；由 app.models 在定义模型后调用一次"""
+
+    def remember(scope, ids, target):
+        from sqlalchemy.orm import object_session
+
+        session = object_session(target)
+        if session is not None:
+            _pending(session)[scope].update(ids)
+
+    for model, link_type in ((computer_model, 'computer'), (workstation_model, 'workstation')):
+        for name in ('after_insert', 'after_update', 'after_delete'):
+            event.listen(model, name, lambda mapper, connection, target, link_type=link_type:
+                         remember(link_type, [target.id], target))
+
+    @event.listens_for(account_model, 'after_update')
+    def _account_updated(mapper, connection, target):
+        if _changed(target, 'chinese_name', 'username'):
+            remember('account', [target.id], target)
+
+    @event.listens_for(system_model, 'after_update')
+    def _system_updated(mapper, connection, target):
+        if _changed(target, 'name', 'system_number', 'group_id', 'group'):
+            remember('system', [target.id], target)
+
+    @event.listens_for(Session, 'before_commit')
+    def _apply(session):
+        # 先 flush 触发映射器事件，再刷新登记的范围
+        apply_pending(session)
+
+    @event.listens_for(Session, 'after_rollback')
+    def _discard(session):
+        session.info.pop(_PENDING_KEY, None)
@@ -0,0 +1,174 @@
+# app/account_search.py
+"""
+系统账户的搜索索引 (用户名、中文名、拼音全拼、拼音首字母)。
+
+SystemAccount.name_pinyin / name_initials 由 chinese_name 自动维护
+(需要安装 pypinyin，未安装时为空，只能按用户名和中文名搜索)。
+
+本模块在其之上维护一个进程内索引：所有账户的检索文本拼接为一个小写字符串，
+子串搜索就是在该字符串上的 str.find (C 实现)，命中位置二分查找到账户；
+5 万个账户的单次搜索约 1 毫秒，取够 limit 个后提前结束。
+
+本进程内账户的新增/修改/删除在事务提交后增量更新索引；
+其他 worker 进程的修改最迟在 ttl 秒后随整表重载生效。
+"""
+import bisect
+import threading
+import time
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+try:
+    from pypinyin import Style, lazy_pinyin
+    PINYIN_AVAILABLE = True
+except ImportError:
+    PINYIN_AVAILABLE = False
+
+# 记录之间、字段之间的分隔符 (不会出现在搜索词中，命中不会跨记录)
+RECORD_SEPARATOR = '\x1e'
+FIELD_SEPARATOR = '\x1f'
+
+
+def pinyin_fields(chinese_name):
+    """返回 (拼音全拼, 拼音首字母)，均为小写；无法计算时为 (None, None)"""
+    if not PINYIN_AVAILABLE or not chinese_name:
+        return None, None
+    full = ''.join(lazy_pinyin(chinese_name)).replace(' ', '').lower()
+    initials = ''.join(lazy_pinyin(chinese_name, style=Style.FIRST_LETTER, errors='ignore')).lower()
+    return full[:255] or None, initials[:64] or None
+
+
+def normalize_term(term):
+    """搜索词：去掉首尾空白和分隔符、转小写"""
+    term = (term or '').replace(RECORD_SEPARATOR, '').replace(FIELD_SEPARATOR, '')
+    return term.strip().lower()
+
+
+class AccountSearchIndex:
+    """进程内的账户子串索引"""
+
+    def __init__(self, ttl=300):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._records = None      # account_id → 检索文本
+        self._loaded_at = 0
+        self._blob = None         # 拼接后的检索文本；记录变化后置为 None，下次搜索时重新拼接
+        self._starts = []
+        self._ids = []
+
+    @staticmethod
+    def _record(username, chinese_name, name_pinyin, name_initials):
+        text = FIELD_SEPARATOR.join((value or '').replace(RECORD_SEPARATOR, '').lower()
+                                    for value in (username, chinese_name, name_pinyin, name_initials))
+        return text
+
+    def _load(self):
+        from app import db
+        from app.models import SystemAccount
+
+        rows = db.session.query(SystemAccount.id, SystemAccount.username, SystemAccount.chinese_name,
+                                SystemAccount.name_pinyin, SystemAccount.name_initials).all()
+        self._records = {row[0]: self._record(*row[1:]) for row in rows}
+        self._blob = None
+        self._loaded_at = time.monotonic()
+
+    def _build_blob(self):
+        starts, ids, parts, offset = [], [], [], 0
+        for account_id, text in self._records.items():
+            starts.append(offset)
+            ids.append(account_id)
+            parts.append(text)
+            offset += len(text) + 1
+        self._blob = RECORD_SEPARATOR.join(parts)
+        self._starts, self._ids = starts, ids
+
+    def search(self, term, limit=None):
+        """返回匹配账户的 id 列表 (无特定顺序)，最多 limit 个"""
+        term = normalize_term(term)
+        if not term:
+            return []
+        with self._lock:
+            if self._records is None or time.monotonic() - self._loaded_at > self.ttl:
+                self._load()
+            if self._blob is None:
+                self._build_blob()
+            blob, starts, ids = self._blob, self._starts, self._ids
+        results = []
+        position = blob.find(term)
+        while position != -1:
+            index = bisect.bisect_right(starts, position) - 1
+            results.append(ids[index])
+            if limit is not None and len(results) >= limit:
+                break
+            # 同一账户只计一次：从下一条记录开始继续查找
+            if index + 1 >= len(starts):
+                break
+            position = blob.find(term, starts[index + 1])
+        return results
+
+    def apply_changes(self, upserts, deletes):
+        """增量更新 (事务提交后调用)"""
+        with self._lock:
+            if self._records is None:
+                return
+            for account_id, values in upserts.items():
+                self._records[account_id] = self._record(*values)
+            for account_id in deletes:
+                self._records.pop(account_id, None)
+            if upserts or deletes:
+                self._blob = None
+
+    def invalidate(self):
+        with self._lock:
+            self._records = None
+            self._blob = None
+
+
+account_search = AccountSearchIndex()
+
+
+def account_search_filter(term):
+    """等价的 SQL 条件 (ilike 全表扫描)，用于匹配结果过多、不适合用 IN 列表的宽泛搜索词"""
+    from sqlalchemy import or_
+    from app.models import SystemAccount
+
+    pattern = f'%{normalize_term(term)}%'
+    return or_(SystemAccount.username.ilike(pattern), SystemAccount.chinese_name.ilike(pattern),
+               SystemAccount.name_pinyin.ilike(pattern), SystemAccount.name_initials.ilike(pattern))
+
+
+# --- 随事务增量更新 ---
+_PENDING_KEY = 'account_search_changes'
+
+
+def _remember(target, deleted=False):
+    from sqlalchemy.orm import object_session
+
+    session = object_session(target)
+    if session is None:
+        return
+    upserts, deletes = session.info.setdefault(_PENDING_KEY, ({}, set()))
+    if deleted:
+        upserts.pop(target.id, None)
+        deletes.add(target.id)
+    else:
+        deletes.discard(target.id)
+        upserts[target.id] = (target.username, target.chinese_name, target.name_pinyin, target.name_initials)
+
+
+def track_account_changes(model):
+    """注册 SystemAccount 的写入事件；由 app.models 在定义模型后调用一次"""
+    event.listen(model, 'after_insert', lambda mapper, connection, target: _remember(target))
+    event.listen(model, 'after_update', lambda mapper, connection, target: _remember(target))
+    event.listen(model, 'after_delete', lambda mapper, connection, target: _remember(target, deleted=True))
+
+    @event.listens_for(Session, 'after_commit')
+    def _apply(session):
+        changes = session.info.pop(_PENDING_KEY, None)
+        if changes:
+            account_search.apply_changes(*changes)
+
+    @event.listens_for(Session, 'after_rollback')
+    def _discard(session):
+        session.info.pop(_PENDING_KEY, None)
@@ -0,0 +1,100 @@
+# app/account_sync.py
+"""
+用 Agent 上报的本地账户列表同步系统的电脑用户 (SystemUser)。
+
+Agent 在心跳中只携带账户列表的摘要；摘要与 System.accounts_digest 不同时
+服务器要求上传完整列表，然后在这里一次性比对：
+  - 主机上存在但平台没有记录的账户：创建 SystemAccount (如不存在) 和 SystemUser；
+  - 双方都有的账户：按主机上的启用状态更新 is_active；
+  - 平台有记录但主机上已不存在的账户：标记为停用 (保留记录供审计)。
+上报列表只包含本地账户，因此停用只针对 is_synced 的链接 (由同步创建，或曾出现在
+上报列表中、确认为本地账户)；域账户和管理员手工维护的其他链接不受同步影响。
+已有链接的 system_role 由管理员维护，不会被覆盖。
+批量启用/停用绕过 ORM 事件，需在 app.access_matrix 中登记以刷新访问矩阵。
+"""
+from datetime import datetime
+
+
+def _normalize_accounts(accounts, ignored):
+    """清洗上报的账户列表，返回 {小写用户名: 账户信息}"""
+    result = {}
+    for item in accounts or []:
+        if not isinstance(item, dict):
+            continue
+        username = (item.get('username') or '').strip()
+        if not username or username.lower() in ignored:
+            continue
+        groups = item.get('groups') or []
+        if isinstance(groups, str):
+            groups = [groups]
+        result[username.lower()] = {
+            'username': username[:64],
+            'full_name': (item.get('full_name') or '').strip()[:64],
+            'enabled': bool(item.get('enabled', True)),
+            'groups': sorted(str(g) for g in groups),
+        }
+    return result
+
+
+def reconcile_system_accounts(system, accounts, digest, ignored=()):
+    """按上报列表同步 system 的电脑用户并记录摘要 (不提交)。
+
+    返回 {'added': n, 'activated': n, 'deactivated': n}。
+    """
+    from app import db
+    from app.models import SystemAccount, SystemUser
+    from app.access_matrix import mark_links_changed
+
+    ignored = {name.lower() for name in ignored}
+    reported = _normalize_accounts(accounts, ignored)
+
+    # 当前链接：一次查询取回 (链接 id, 小写用户名, 是否启用, 是否本地账户)
+    links = (db.session.query(SystemUser.id, db.func.lower(SystemAccount.username), SystemUser.is_active,
+                              SystemUser.is_synced)
+             .join(SystemAccount, SystemAccount.id == SystemUser.account_id)
+             .filter(SystemUser.system_id == system.id).all())
+    linked = {username: (link_id, is_active, is_synced) for link_id, username, is_active, is_synced in links}
+
+    to_activate, to_deactivate, to_mark_synced = [], [], []
+    for username, (link_id, is_active, is_synced) in linked.items():
+        if username in ignored:
+            continue
+        if username in reported:
+            if not is_synced:
+                to_mark_synced.append(link_id)
+            if reported[username]['enabled'] != is_active:
+                (to_activate if reported[username]['enabled'] else to_deactivate).append(link_id)
+        elif is_synced and is_active:
+            # 只停用确认过的本地账户；不在列表中的其他链接可能是域账户或手工录入，留给管理员处理
+            to_deactivate.append(link_id)
+
+    missing = [name for name in reported if name not in linked]
+    added = 0
+    if missing:
+        existing = {account.username.lower(): account for account in SystemAccount.query.filter(
+            db.func.lower(SystemAccount.username).in_(missing)).all()}
+        for name in missing:
+            info = reported[name]
+            account = existing.get(name)
+            if account is None:
+                account = SystemAccount(username=info['username'], chinese_name=info['full_name'] or info['username'])
+                db.session.add(account)
+            db.session.add(SystemUser(system_id=system.id, account=account, is_active=info['enabled'], is_synced=True,
+                                      system_role=', '.join(info['groups'])[:64] or None))
+            added += 1
+
+    if to_mark_synced:
+        SystemUser.query.filter(SystemUser.id.in_(to_mark_synced)).update(
+            {'is_synced': True}, synchronize_session=False)
+    if to_activate:
+        SystemUser.query.filter(SystemUser.id.in_(to_activate)).update(
+            {'is_active': True}, synchronize_session=False)
+        mark_links_changed('computer', to_activate)
+    if to_deactivate:
+        SystemUser.query.filter(SystemUser.id.in_(to_deactivate)).update(
+            {'is_active': False}, synchronize_session=False)
+        mark_links_changed('computer', to_deactivate)
+
+    system.accounts_digest = digest
+    system.accounts_synced_at = datetime.utcnow()
+    return {'added': added, 'activated': len(to_activate), 'deactivated': len(to_deactivate)}
@@ -0,0 +1,128 @@
+# app/agent_presence.py
+"""
+Agent 存活记录与卡死任务回收。
+
+心跳只把“系统 → 最近心跳时间”写入进程内缓冲，后台线程每隔
+AGENT_LAST_SEEN_FLUSH_SECONDS 用一条 executemany UPDATE 批量写回
+System.last_seen_at，心跳本身不再产生写事务。
+
+reap_stuck_jobs 由调度器的租约持有者定期调用：running 状态超过
+JOB_RUNNING_TIMEOUT_SECONDS 仍未上报结果的任务 (Agent 崩溃、断电等)，
+领取次数未达上限的重新排队 (同时清空上一次运行已上报的输出，新的运行从偏移 0 开始上报)，
+否则标记为失败。
+"""
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import bindparam, or_
+
+
+class LastSeenBuffer:
+    """合并心跳时间，定期批量写入数据库"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def touch(self, system_id, when=None):
+        with self._lock:
+            self._pending[system_id] = when or datetime.utcnow()
+
+    def get(self, system_id):
+        """本进程尚未写回的最近心跳时间"""
+        with self._lock:
+            return self._pending.get(system_id)
+
+    def flush(self):
+        """把缓冲的心跳时间写回数据库，返回更新的系统数"""
+        from app import db
+        from app.models import System
+
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+        table = System.__table__
+        statement = (table.update()
+                     .where(table.c.id == bindparam('b_id'))
+                     .where(or_(table.c.last_seen_at.is_(None), table.c.last_seen_at < bindparam('b_seen')))
+                     .values(last_seen_at=bindparam('b_seen')))
+        try:
+            db.session.execute(statement, [{'b_id': system_id, 'b_seen': seen} for system_id, seen in pending.items()])
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            # 写入失败时放回缓冲，下次再试 (期间的新心跳优先)
+            with self._lock:
+                for system_id, seen in pending.items():
+                    self._pending.setdefault(system_id, seen)
+            raise
+        return len(pending)
+
+    def _run(self, app):
+        interval = app.config.get('AGENT_LAST_SEEN_FLUSH_SECONDS', 30)
+        while True:
+            time.sleep(interval)
+            try:
+                with app.app_context():
+                    self.flush()
+            except Exception as e:
+                print(f"[agent_presence] 写入心跳时间失败: {e}")
+
+    def ensure_started(self, app):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, args=(app,), name='last-seen-flusher', daemon=True)
+            self._thread.start()
+
+
+last_seen_buffer = LastSeenBuffer()
+
+
+def is_agent_online(system, offline_after):
+    """根据 last_seen_at (以及本进程未写回的心跳) 判断 Agent 是否在线"""
+    seen = last_seen_buffer.get(system.id) or system.last_seen_at
+    return seen is not None and datetime.utcnow() - seen < timedelta(seconds=offline_after)
+
+
+def reap_stuck_jobs(timeout_seconds, max_attempts, limit=500):
+    """回收超时未上报的 running 任务，返回 (重新排队数, 标记失败数)"""
+    from app import db
+    from app.models import Job, JobOutputChunk
+    from app.job_signals import notify_job_update, notify_system_jobs
+
+    now = datetime.utcnow()
+    cutoff = now - timedelta(seconds=timeout_seconds)
+    # 由 (status, started_at) 索引支撑
+    stuck = (db.session.query(Job.id, Job.system_id, Job.broadcast_id, Job.attempts, Job.started_at)
+             .filter(Job.status == 'running', Job.started_at < cutoff)
+             .order_by(Job.started_at).limit(limit).all())
+    requeued, failed = [], []
+    for job_id, system_id, broadcast_id, attempts, started_at in stuck:
+        # 带 status/started_at 条件，避免覆盖同时到达的结果上报
+        query = Job.query.filter(Job.id == job_id, Job.status == 'running', Job.started_at == started_at)
+        if (attempts or 0) < max_attempts:
+            if query.update({'status': 'pending', 'started_at': None, 'output_size': 0, 'output_stored_bytes': 0},
+                            synchronize_session=False):
+                requeued.append((job_id, system_id, broadcast_id))
+        elif query.update({'status': 'failed', 'completed_at': now}, synchronize_session=False):
+            failed.append((job_id, system_id, broadcast_id))
+    if requeued:
+        JobOutputChunk.query.filter(JobOutputChunk.job_id.in_([job_id for job_id, _, _ in requeued])).delete(
+            synchronize_session=False)
+    for job_id, _, _ in failed:
+        db.session.get(Job, job_id).append_output(
+            f"\n\n[服务器] 任务在 {timeout_seconds} 秒内未上报结果，已标记为失败 (共领取 {max_attempts} 次)。")
+    db.session.commit()
+
+    for job_id, system_id, broadcast_id in requeued + failed:
+        notify_job_update(job_id, broadcast_id)
+    for system_id in {system_id for _, system_id, _ in requeued}:
+        notify_system_jobs(system_id)
+    return len(requeued), len(failed)
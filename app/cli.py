@@ -54,4 +54,96 @@ def register(app):
                 db.session.commit()
                 click.echo('Created sample systems.')
             
-            click.echo("Database initialization complete.")
\ No newline at end of file
+            click.echo("Database initialization complete.")
+
+    @app.cli.command('job-output-stats')
+    def job_output_stats_command():
+        """统计任务输出占用的存储空间 (原始大小 / 压缩后大小)。"""
+        with app.app_context():
+            total_jobs, raw_size, stored_size = db.session.query(
+                db.func.count(Job.id),
+                db.func.coalesce(db.func.sum(Job.output_size), 0),
+                db.func.coalesce(db.func.sum(Job.output_stored_bytes), 0)).one()
+            click.echo(f'任务总数: {total_jobs}')
+            click.echo(f'输出原始大小: {raw_size} 字符')
+            click.echo(f'输出存储大小: {stored_size} 字节')
+
+            click.echo('按脚本统计 (存储大小降序):')
+            rows = (db.session.query(Script.name, db.func.count(Job.id),
+                                     db.func.sum(Job.output_size), db.func.sum(Job.output_stored_bytes))
+                    .join(Job, Job.script_id == Script.id)
+                    .group_by(Script.name)
+                    .order_by(db.func.sum(Job.output_stored_bytes).desc()).all())
+            for name, count, raw, stored in rows:
+                click.echo(f'  {name}: {count} 个任务, 原始 {raw or 0} 字符, 存储 {stored or 0} 字节')
+
+    @app.cli.command('run-scheduler')
+    @click.option('--once', is_flag=True, help='只检查一次到期计划后退出 (可配合系统计划任务使用)。')
+    def run_scheduler_command(once):
+        """运行定时执行计划的调度循环 (多个实例同时运行时只有租约持有者生成任务)。"""
+        from app.scheduler import scheduler
+        if not once:
+            click.echo(f'调度器已启动 ({scheduler.holder})，按 Ctrl+C 退出。')
+            scheduler.run_forever(app)
+        results = scheduler.tick(app)
+        if results is None:
+            click.echo('其他调度器实例持有租约，本次未执行。')
+        for schedule_id, count in results or []:
+            click.echo(f'计划 {schedule_id}: 创建了 {count} 个任务')
+
+    @app.cli.command('archive-jobs')
+    @click.option('--days', type=int, default=None, help='归档多少天前结束的任务 (默认使用 JOB_RETENTION_DAYS)。')
+    @click.option('--batch-size', type=int, default=None, help='每批 (每个事务) 归档的任务数。')
+    @click.option('--pause', type=float, default=0.1, help='两批之间暂停的秒数。')
+    def archive_jobs_command(days, batch_size, pause):
+        """把已结束的历史任务分批迁入 job_archive 表。"""
+        from app.retention import archive_old_jobs
+        days = days if days is not None else app.config['JOB_RETENTION_DAYS']
+        if not days:
+            click.echo('JOB_RETENTION_DAYS 为 0，未执行归档。')
+            return
+        with app.app_context():
+            archived = archive_old_jobs(days, batch_size=batch_size or app.config['JOB_ARCHIVE_BATCH_SIZE'], pause=pause)
+        click.echo(f'已归档 {archived} 个 {days} 天前结束的任务。')
+
+    @app.cli.command('reap-jobs')
+    def reap_jobs_command():
+        """立即回收超时未上报结果的 running 任务。"""
+        from app.agent_presence import reap_stuck_jobs
+        with app.app_context():
+            requeued, failed = reap_stuck_jobs(app.config['JOB_RUNNING_TIMEOUT_SECONDS'], app.config['JOB_MAX_ATTEMPTS'])
+        click.echo(f'重新排队 {requeued} 个任务，标记失败 {failed} 个任务。')
+
+    @app.cli.command('refresh-account-pinyin')
+    @click.option('--batch-size', type=int, default=1000, help='每批 (每个事务) 更新的账户数。')
+    def refresh_account_pinyin_command(batch_size):
+        """重新计算所有系统账户的拼音全拼和首字母 (安装 pypinyin 后执行一次)。"""
+        from app.models import SystemAccount
+        from app.account_search import PINYIN_AVAILABLE, pinyin_fields
+        if not PINYIN_AVAILABLE:
+            click.echo('未安装 pypinyin，无法计算拼音。请先执行 pip install pypinyin。')
+            return
+        updated, last_id = 0, 0
+        with app.app_context():
+            while True:
+                rows = (db.session.query(SystemAccount.id, SystemAccount.chinese_name)
+                        .filter(SystemAccount.id > last_id).order_by(SystemAccount.id).limit(batch_size).all())
+                if not rows:
+                    break
+                values = [{'id': account_id, 'name_pinyin': full, 'name_initials': initials}
+                          for account_id, chinese_name in rows
+                          for full, initials in [pinyin_fields(chinese_name)]]
+                db.session.bulk_update_mappings(SystemAccount, values)
+                db.session.commit()
+                updated += len(values)
+                last_id = rows[-1].id
+        click.echo(f'已更新 {updated} 个账户的拼音。')
+
+    @app.cli.command('rebuild-access-matrix')
+    def rebuild_access_matrix_command():
+        """从电脑用户和工作站用户链接全量重建人员 × 系统访问矩阵。"""
+        from app.access_matrix import rebuild_access_matrix
+        with app.app_context():
+            count = rebuild_access_matrix()
+            db.session.commit()
+        click.echo(f'访问矩阵已重建，共 {count} 行。')
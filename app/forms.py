@@ -178,6 +178,28 @@ class ExecuteJobForm(FlaskForm):
     script = SelectField('选择要执行的脚本', coerce=int, validators=[DataRequired()])
     submit = SubmitField('立即执行')
     
+class JobScheduleForm(FlaskForm):
+    """定时执行计划"""
+    name = StringField('计划名称', validators=[DataRequired(), Length(max=100)])
+    script = SelectField('脚本', coerce=int, validators=[DataRequired()])
+    group = SelectField('目标分组', coerce=int)
+    systems = SelectMultipleField('或选择系统', coerce=int, render_kw={"size": 8})
+    cron = StringField('执行时间 (cron, UTC)', validators=[DataRequired()], default='0 2 * * *',
+                       render_kw={"placeholder": "分 时 日 月 周，例如 0 2 * * * 表示每天 02:00"})
+    jitter_minutes = IntegerField('错峰窗口 (分钟)', default=30, validators=[Optional(), NumberRange(min=0, max=24 * 60)])
+    submit = SubmitField('创建计划')
+
+    def validate_cron(self, cron):
+        from app.scheduler import CronExpression
+        try:
+            CronExpression(cron.data)
+        except ValueError as e:
+            raise ValidationError(str(e))
+
+    def validate_systems(self, systems):
+        if not self.group.data and not systems.data:
+            raise ValidationError('请选择目标分组或至少一个系统。')
+
 # --- 新增：确保这个类存在 ---
 class BatchImportForm(FlaskForm):
     """用于批量导入用户的表单"""
@@ -0,0 +1,70 @@
+# app/hostname_index.py
+"""
+主机名 → 系统 的查找索引。
+
+System.hostname_key 保存规范化 (去空格、小写、去掉末尾的点) 后的计算机名，
+并建有普通索引；本模块在其之上维护一个进程内的字典，心跳、任务上报和
+Avamar 状态同步都通过它匹配主机，不再对 system 表做 ilike 扫描。
+"""
+import threading
+import time
+
+
+def normalize_hostname(hostname):
+    """规范化计算机名，空值返回 None"""
+    if not hostname:
+        return None
+    key = hostname.strip().rstrip('.').lower()
+    return key or None
+
+
+class HostnameIndex:
+    """进程内的 hostname_key → system_id 映射。
+
+    本进程内新增/编辑/删除系统后调用 invalidate() 立即失效；
+    其他 worker 进程的修改最迟在 ttl 秒后随整表重载生效，
+    在此之前未命中的主机会回退到按索引列的单行查询。
+    """
+
+    def __init__(self, ttl=300):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._map = None
+        self._loaded_at = 0
+
+    def _load(self):
+        from app import db
+        from app.models import System
+        rows = (db.session.query(System.hostname_key, System.id)
+                .filter(System.hostname_key.isnot(None), System.hostname_key != '').all())
+        self._map = {key: system_id for key, system_id in rows}
+        self._loaded_at = time.monotonic()
+
+    def _ensure_loaded(self):
+        with self._lock:
+            if self._map is None or time.monotonic() - self._loaded_at > self.ttl:
+                self._load()
+
+    def lookup(self, hostname):
+        """返回主机名对应的 system_id，找不到返回 None"""
+        key = normalize_hostname(hostname)
+        if not key:
+            return None
+        self._ensure_loaded()
+        system_id = self._map.get(key)
+        if system_id is None:
+            from app.models import System
+            system = System.query.with_entities(System.id).filter(System.hostname_key == key).first()
+            if system:
+                system_id = system.id
+                with self._lock:
+                    if self._map is not None:
+                        self._map[key] = system_id
+        return system_id
+
+    def invalidate(self):
+        with self._lock:
+            self._map = None
+
+
+hostname_index = HostnameIndex()
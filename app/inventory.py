@@ -0,0 +1,106 @@
+# app/inventory.py
+"""
+从任务输出中提取结构化的硬件/系统信息。
+
+按脚本名称注册解析函数；Agent 上报任务结果时，如果脚本已注册，
+解析输出得到 os_name / manufacturer / model / ram_gb 等字段并写入
+system_inventory。只有与该系统当前快照不同时才新增一行 (旧行的
+is_current 置为 False)，未变化时只刷新 confirmed_at。
+"""
+import re
+from datetime import datetime
+
+INVENTORY_FIELDS = ('os_name', 'manufacturer', 'model', 'ram_gb')
+
+# 脚本名称 (小写) → 解析函数 (输出文本 → 字段字典)
+INVENTORY_PARSERS = {}
+
+
+def inventory_parser(*script_names):
+    """注册解析函数的装饰器，一个解析函数可以对应多个脚本名"""
+    def decorator(func):
+        for name in script_names:
+            INVENTORY_PARSERS[name.lower()] = func
+        return func
+    return decorator
+
+
+def parse_format_list(text):
+    """解析 PowerShell Format-List 的输出 (“名称 : 值”，过长的值会缩进换行续写)"""
+    values = {}
+    key = None
+    for line in (text or '').splitlines():
+        match = re.match(r'^(\w+)\s*:\s?(.*)$', line)
+        if match:
+            key = match.group(1)
+            values[key] = match.group(2).strip()
+        elif key and line[:1].isspace() and line.strip():
+            values[key] = f"{values[key]} {line.strip()}"
+        elif not line.strip():
+            key = None
+    return values
+
+
+def _to_float(value):
+    match = re.search(r'\d+(?:\.\d+)?', (value or '').replace(',', ''))
+    return float(match.group()) if match else None
+
+
+@inventory_parser('Get-System-Info')
+def parse_system_info(text):
+    values = parse_format_list(text)
+    ram_gb = _to_float(values.get('RamSizeGB'))
+    if ram_gb is not None:
+        # 与 SystemInventory.ram_gb 的精度 (1 位小数) 一致，否则变化检测永远不相等
+        ram_gb = round(ram_gb, 1)
+    if ram_gb is None and values.get('CsTotalPhysicalMemory'):
+        # Get-ComputerInfo 原生属性，单位为字节
+        total = _to_float(values['CsTotalPhysicalMemory'])
+        ram_gb = round(total / 1024 ** 3, 1) if total else None
+    if ram_gb is None and values.get('CsPhysicallyInstalledMemory'):
+        # 单位为 KB
+        total = _to_float(values['CsPhysicallyInstalledMemory'])
+        ram_gb = round(total / 1024 ** 2, 1) if total else None
+    return {
+        'os_name': values.get('OsName') or None,
+        'manufacturer': values.get('CsManufacturer') or None,
+        'model': values.get('CsModel') or None,
+        'ram_gb': ram_gb,
+    }
+
+
+def record_inventory(job, output):
+    """job 的输出来自已注册的清单脚本时，解析并按需写入新快照 (不提交)。
+
+    返回新写入的 SystemInventory，未变化或无法解析时返回 None。
+    """
+    from app import db
+    from app.models import SystemInventory
+
+    if job.status != 'completed' or job.script is None:
+        return None
+    parser = INVENTORY_PARSERS.get(job.script.name.lower())
+    if parser is None:
+        return None
+    try:
+        values = parser(output or '')
+    except Exception as e:
+        # 解析失败不影响任务结果的保存
+        print(f"[inventory] 解析任务 {job.id} 的输出失败: {e}")
+        return None
+    if not any(values.get(field) is not None for field in INVENTORY_FIELDS):
+        return None
+
+    now = datetime.utcnow()
+    current = SystemInventory.query.filter_by(system_id=job.system_id, is_current=True).first()
+    if current is not None and all(getattr(current, field) == values.get(field) for field in INVENTORY_FIELDS):
+        current.confirmed_at = now
+        current.job_id = job.id
+        return None
+    if current is not None:
+        current.is_current = False
+    snapshot = SystemInventory(system_id=job.system_id, job_id=job.id, is_current=True,
+                               collected_at=now, confirmed_at=now,
+                               **{field: values.get(field) for field in INVENTORY_FIELDS})
+    db.session.add(snapshot)
+    return snapshot
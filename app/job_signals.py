@@ -0,0 +1,131 @@
+# app/job_signals.py
+"""
+进程内的任务信号中心。
+
+长轮询心跳在没有任务时会挂起等待，直到有新任务入队或超时。
+同一进程内创建的任务会直接唤醒对应系统的等待者；其他 worker 进程
+创建的任务由一个后台线程按主键增量扫描 job 表来发现 (每个进程只有
+一个扫描线程，查询量与 Agent 数量无关)。
+
+任务状态推送 (SSE) 复用同一个信号中心：('job', id) 和 ('broadcast', id)
+在任务被领取、追加输出和上报结果时发出通知，只有存在订阅者时才记录。
+"""
+import threading
+import time
+from contextlib import contextmanager
+
+
+class SignalHub:
+    """按 key 分组的版本号 + 条件变量，避免“先查询后等待”之间丢失通知。"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._versions = {}
+        self._conditions = {}
+        self._watchers = {}
+
+    def _condition(self, key):
+        with self._lock:
+            cond = self._conditions.get(key)
+            if cond is None:
+                cond = self._conditions[key] = threading.Condition(self._lock)
+            return cond
+
+    def version(self, key):
+        with self._lock:
+            return self._versions.get(key, 0)
+
+    def notify(self, key, watched_only=False):
+        """watched_only=True 时只在 key 有订阅者 (见 watch) 时记录，避免为无人关注的 key 占用内存"""
+        with self._lock:
+            if watched_only and key not in self._watchers:
+                return
+            self._versions[key] = self._versions.get(key, 0) + 1
+            cond = self._conditions.get(key)
+            if cond is not None:
+                cond.notify_all()
+
+    def wait(self, key, since, timeout):
+        """等待 key 的版本号超过 since；收到通知返回 True，超时返回 False。"""
+        cond = self._condition(key)
+        deadline = time.monotonic() + timeout
+        with self._lock:
+            while self._versions.get(key, 0) == since:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                cond.wait(remaining)
+            return True
+
+    @contextmanager
+    def watch(self, key):
+        """订阅 key；最后一个订阅者退出时清理该 key 的版本号和条件变量"""
+        with self._lock:
+            self._watchers[key] = self._watchers.get(key, 0) + 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                remaining = self._watchers[key] - 1
+                if remaining:
+                    self._watchers[key] = remaining
+                else:
+                    del self._watchers[key]
+                    self._versions.pop(key, None)
+                    self._conditions.pop(key, None)
+
+
+class NewJobWatcher:
+    """后台线程：发现其他进程新建的任务并唤醒本进程内等待的心跳。"""
+
+    def __init__(self, hub):
+        self.hub = hub
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._last_job_id = None
+
+    def ensure_started(self, app):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, args=(app,), name='new-job-watcher', daemon=True)
+            self._thread.start()
+
+    def _run(self, app):
+        from app import db
+        from app.models import Job
+
+        interval = app.config.get('AGENT_LONG_POLL_WATCH_INTERVAL', 1)
+        while True:
+            try:
+                with app.app_context():
+                    if self._last_job_id is None:
+                        self._last_job_id = db.session.query(db.func.max(Job.id)).scalar() or 0
+                    else:
+                        rows = (db.session.query(Job.id, Job.system_id)
+                                .filter(Job.id > self._last_job_id)
+                                .order_by(Job.id).all())
+                        for job_id, system_id in rows:
+                            self._last_job_id = job_id
+                            self.hub.notify(('system', system_id))
+            except Exception as e:
+                print(f"[job_signals] 扫描新任务失败: {e}")
+            time.sleep(interval)
+
+
+job_hub = SignalHub()
+new_job_watcher = NewJobWatcher(job_hub)
+
+
+def notify_system_jobs(system_id):
+    """在本进程内唤醒等待该系统任务的长轮询心跳。"""
+    job_hub.notify(('system', system_id))
+
+
+def notify_job_update(job_id, broadcast_id=None):
+    """任务状态或输出变化后 (事务提交之后) 唤醒本进程内订阅它的推送连接。"""
+    job_hub.notify(('job', job_id), watched_only=True)
+    if broadcast_id:
+        job_hub.notify(('broadcast', broadcast_id), watched_only=True)
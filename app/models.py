@@ -4,7 +4,14 @@ from datetime import date, datetime, timedelta
 from app import db, login
 from werkzeug.security import generate_password_hash, check_password_hash
 from flask_login import UserMixin
+from sqlalchemy.orm import validates
+from app.hostname_index import normalize_hostname
+from app.account_search import pinyin_fields, track_account_changes
+from app.access_matrix import track_access_changes
+import hashlib
 import json
+import random
+import zlib
 
 # --- 平台用户模型 (Platform User) ---
 # 这个模型只用于登录本平台的用户账户管理。
@@ -40,18 +47,34 @@ class User(UserMixin, db.Model):
 # 这个模型用于记录所有存在于目标计算机/工作站上的账户信息。
 class SystemAccount(db.Model):
     __tablename__ = 'system_accounts'
+    __table_args__ = (
+        # 用户目录按 (中文名, 用户名) 排序并以此为游标分页
+        db.Index('ix_system_accounts_name_username', 'chinese_name', 'username'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(64), index=True, unique=True, nullable=False)
     chinese_name = db.Column(db.String(64), index=True, nullable=False)
+    # 中文名的拼音全拼和首字母 (小写)，由 chinese_name 自动维护，供按拼音搜索 (如 "zs" → 张三)
+    name_pinyin = db.Column(db.String(255), nullable=True)
+    name_initials = db.Column(db.String(64), nullable=True)
 
     # 反向关系，方便查询一个账户在哪些系统中有权限
     system_access = db.relationship('SystemUser', backref='account', lazy='dynamic', cascade="all, delete-orphan")
     workstation_access = db.relationship('WorkstationUser', backref='account', lazy='dynamic', cascade="all, delete-orphan")
+
+    @validates('chinese_name')
+    def _sync_pinyin(self, key, value):
+        self.name_pinyin, self.name_initials = pinyin_fields(value)
+        return value
     
     def __repr__(self):
         return f'<System Account {self.username}>'
 
 
+# 账户变化时在事务提交后增量更新进程内的搜索索引
+track_account_changes(SystemAccount)
+
+
 # --- 关联表模型 (修改外键以关联到 SystemAccount) ---
 class SystemUser(db.Model):
     __tablename__ = 'system_user_link'
@@ -60,6 +83,8 @@ class SystemUser(db.Model):
     account_id = db.Column(db.Integer, db.ForeignKey('system_accounts.id'), nullable=False)
     system_role = db.Column(db.String(64))
     is_active = db.Column(db.Boolean, default=True, nullable=False, index=True)
+    # 是否为 Agent 同步确认的本地账户 (同步创建或出现在上报列表中)；只有这类链接会被同步停用
+    is_synced = db.Column(db.Boolean, default=False, nullable=False)
 
 class WorkstationUser(db.Model):
     __tablename__ = 'workstation_user_link'
@@ -71,6 +96,32 @@ class WorkstationUser(db.Model):
     is_active = db.Column(db.Boolean, default=True, nullable=False, index=True)
 
 
+class AccessMatrix(db.Model):
+    """人员 × 系统访问矩阵：每条电脑/工作站用户链接一行，冗余保存人员、系统和角色 (由 app.access_matrix 维护)"""
+    __tablename__ = 'access_matrix'
+    __table_args__ = (
+        db.UniqueConstraint('link_type', 'link_id', name='uq_access_matrix_link'),
+        # 用户目录：活动权限按 (中文名, 用户名) 分页
+        db.Index('ix_access_matrix_active_name', 'is_active', 'chinese_name', 'username'),
+        db.Index('ix_access_matrix_name', 'chinese_name'),
+        db.Index('ix_access_matrix_account', 'account_id'),
+        db.Index('ix_access_matrix_system', 'system_id', 'link_type'),
+        db.Index('ix_access_matrix_group', 'group_id'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    link_type = db.Column(db.String(16), nullable=False)  # 'computer' / 'workstation'
+    link_id = db.Column(db.Integer, nullable=False)
+    account_id = db.Column(db.Integer, nullable=False)
+    chinese_name = db.Column(db.String(64), nullable=False)
+    username = db.Column(db.String(64), nullable=False)
+    system_id = db.Column(db.Integer, nullable=False)
+    system_number = db.Column(db.String(50), nullable=False)
+    system_name = db.Column(db.String(150), nullable=False)
+    group_id = db.Column(db.Integer, nullable=True)
+    role = db.Column(db.String(64), nullable=True)
+    is_active = db.Column(db.Boolean, nullable=False)
+
+
 # --- 申请模型 (修改关联) ---
 class UserRequest(db.Model):
     # 这个模型用于用户提交的“新增系统用户”的申请
@@ -115,7 +166,16 @@ class System(db.Model):
     # --- 常规信息 ---
     group_id = db.Column(db.Integer, db.ForeignKey('group.id'), nullable=True)
     computer_name = db.Column(db.String(100), nullable=True)
-    ip_address = db.Column(db.String(45), nullable=True)
+    # 规范化后的计算机名 (小写)，由 computer_name 自动维护，供 Agent 按主机名查找系统
+    hostname_key = db.Column(db.String(100), nullable=True, index=True)
+    # Agent 上报的本地账户列表摘要及最近一次同步时间，摘要变化时才重新同步电脑用户
+    accounts_digest = db.Column(db.String(64), nullable=True)
+    accounts_synced_at = db.Column(db.DateTime, nullable=True)
+    # 最近一次 Agent 心跳时间 (由 app.agent_presence 批量写入，可能有几十秒延迟)
+    last_seen_at = db.Column(db.DateTime, nullable=True)
+    # 管理员最近一次查看或操作该系统的时间 (节流写入)，用于缩短该主机的心跳间隔
+    last_admin_activity_at = db.Column(db.DateTime, nullable=True)
+    ip_address = db.Column(db.String(45), nullable=True, index=True)
     is_domain_joined = db.Column(db.Boolean, default=False)
     is_workstation_domain_joined = db.Column(db.Boolean, default=False)
     notes = db.Column(db.Text, nullable=True)
@@ -150,6 +210,11 @@ class System(db.Model):
     workstation_users = db.relationship('WorkstationUser', backref='system', lazy='dynamic', cascade="all, delete-orphan")
     
     # --- 方法 (Methods) ---
+    @validates('computer_name')
+    def _sync_hostname_key(self, key, value):
+        self.hostname_key = normalize_hostname(value)
+        return value
+
     def get_next_verification_date(self):
         if self.is_restore_verified and self.last_restore_verification_date and self.restore_verification_cycle:
             try:
@@ -173,6 +238,12 @@ class System(db.Model):
     def is_qa_overdue(self):
         if not self.qa_next_check_date: return False
         return (self.qa_next_check_date - date.today()).days < 0
+
+
+# 链接、账户姓名、系统名称变化时在同一事务中刷新访问矩阵
+track_access_changes(SystemAccount, System, SystemUser, WorkstationUser)
+
+
 class RoleChangeRequest(db.Model):
     __tablename__ = 'role_change_requests'
     id = db.Column(db.Integer, primary_key=True)
@@ -211,27 +282,263 @@ class SystemRole(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(50), unique=True, nullable=False)
 
+def script_content_hash(content):
+    """脚本内容的 SHA-256，Agent 端用同样的算法校验缓存"""
+    return hashlib.sha256((content or '').encode('utf-8')).hexdigest()
+
 class Script(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), unique=True, nullable=False)
     description = db.Column(db.Text, nullable=True)
     content = db.Column(db.Text, nullable=False)
+    # 内容哈希，由 content 自动维护；心跳只下发哈希，Agent 按哈希缓存脚本正文
+    content_hash = db.Column(db.String(64), nullable=True, index=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
+    @validates('content')
+    def _sync_content_hash(self, key, value):
+        self.content_hash = script_content_hash(value)
+        return value
+
+class ScriptVersion(db.Model):
+    """脚本被修改前的历史内容，保证已下发的哈希在脚本修改后仍能取到正文"""
+    __tablename__ = 'script_version'
+    id = db.Column(db.Integer, primary_key=True)
+    content_hash = db.Column(db.String(64), unique=True, nullable=False, index=True)
+    content = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    @classmethod
+    def archive(cls, script):
+        """在修改脚本内容之前保存当前版本 (已存在则跳过)"""
+        if script.content_hash and not cls.query.filter_by(content_hash=script.content_hash).first():
+            db.session.add(cls(content_hash=script.content_hash, content=script.content))
+
+    @classmethod
+    def find_content(cls, content_hash):
+        script = Script.query.filter_by(content_hash=content_hash).first()
+        if script:
+            return script.content
+        version = cls.query.filter_by(content_hash=content_hash).first()
+        return version.content if version else None
+
 class Job(db.Model):
+    __table_args__ = (
+        # 心跳领取任务: WHERE system_id=? AND status='pending' ORDER BY created_at
+        db.Index('ix_job_system_status_created', 'system_id', 'status', 'created_at'),
+        # 执行面板取每个系统的最新任务: SELECT MAX(id) ... GROUP BY system_id
+        db.Index('ix_job_system_id_id', 'system_id', 'id'),
+        # 批量执行进度: WHERE broadcast_id=? GROUP BY status
+        db.Index('ix_job_broadcast_status', 'broadcast_id', 'status'),
+        # 删除脚本前检查引用: WHERE script_id=?
+        db.Index('ix_job_script_id', 'script_id'),
+        # 历史归档扫描: WHERE status IN (...) AND completed_at < ?
+        db.Index('ix_job_status_completed', 'status', 'completed_at'),
+        # 卡死任务回收: WHERE status='running' AND started_at < ?
+        db.Index('ix_job_status_started', 'status', 'started_at'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     system_id = db.Column(db.Integer, db.ForeignKey('system.id'), nullable=False)
     script_id = db.Column(db.Integer, db.ForeignKey('script.id'), nullable=False)
     requested_by_id = db.Column(db.Integer, db.ForeignKey('platform_users.id'), nullable=False)
+    broadcast_id = db.Column(db.Integer, db.ForeignKey('broadcast.id'), nullable=True)
     status = db.Column(db.String(20), default='pending', index=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    not_before = db.Column(db.DateTime, nullable=True)  # 定时任务错峰：此时间之前不会被 Agent 领取
+    attempts = db.Column(db.Integer, default=0, nullable=False)  # 被 Agent 领取的次数 (超时回收后可重新领取)
     started_at = db.Column(db.DateTime, nullable=True)
     completed_at = db.Column(db.DateTime, nullable=True)
-    output = db.Column(db.Text, nullable=True)
+    # 输出正文保存在 job_output_chunk 表中 (zlib 压缩)，这里只记录大小，
+    # 列表页查询 job 时不会把输出读入内存
+    output_size = db.Column(db.Integer, default=0, nullable=False)          # 原始字符数
+    output_stored_bytes = db.Column(db.Integer, default=0, nullable=False)  # 压缩后字节数
     system = db.relationship('System')
     script = db.relationship('Script')
     requester = db.relationship('User')
+    output_chunks = db.relationship('JobOutputChunk', backref='job', lazy='dynamic',
+                                    cascade="all, delete-orphan", order_by='JobOutputChunk.offset')
+
+    @classmethod
+    def bulk_create(cls, system_ids, script_id, requested_by_id, broadcast_id=None,
+                    run_at=None, jitter_seconds=0, batch_size=1000):
+        """用多行 INSERT 批量创建待执行任务 (每 batch_size 行一条语句)，调用方负责提交事务。
+
+        jitter_seconds > 0 时每个任务的 not_before 在 [run_at, run_at + jitter_seconds)
+        内随机分布，让大量 Agent 分散领取。
+        """
+        now = datetime.utcnow()
+        run_at = run_at or now
+        rows = [{'system_id': system_id, 'script_id': script_id, 'requested_by_id': requested_by_id,
+                 'broadcast_id': broadcast_id, 'status': 'pending', 'created_at': now,
+                 'not_before': run_at + timedelta(seconds=random.uniform(0, jitter_seconds)) if jitter_seconds else None,
+                 'attempts': 0, 'output_size': 0, 'output_stored_bytes': 0}
+                for system_id in system_ids]
+        for start in range(0, len(rows), batch_size):
+            db.session.execute(cls.__table__.insert().values(rows[start:start + batch_size]))
+        return len(rows)
+
+    @property
+    def output(self):
+        return self.read_output()
+
+    def read_output(self, offset=0):
+        """读取 offset (字符数) 之后的输出，只加载覆盖该范围的分块"""
+        offset = max(0, offset or 0)
+        if offset >= (self.output_size or 0):
+            return ''
+        chunks = self.output_chunks.filter(JobOutputChunk.offset + JobOutputChunk.length > offset).all()
+        if not chunks:
+            return ''
+        text = ''.join(chunk.text for chunk in chunks)
+        return text[offset - chunks[0].offset:]
+
+    def append_output(self, text):
+        """在输出末尾追加一段文本，调用方负责提交事务"""
+        if not text:
+            return
+        chunk = JobOutputChunk.from_text(text, offset=self.output_size or 0)
+        self.output_chunks.append(chunk)
+        self.output_size = (self.output_size or 0) + chunk.length
+        self.output_stored_bytes = (self.output_stored_bytes or 0) + len(chunk.data)
+
+    def replace_output(self, text):
+        """用完整文本替换全部输出 (存为单个压缩块)"""
+        JobOutputChunk.query.filter_by(job_id=self.id).delete(synchronize_session=False)
+        self.output_size = 0
+        self.output_stored_bytes = 0
+        self.append_output(text or '')
+
+    def compact_output(self):
+        """把流式上报产生的多个小块合并为一个，压缩效果更好"""
+        if self.output_chunks.count() > 1:
+            self.replace_output(self.read_output())
+
+
+class Broadcast(db.Model):
+    """一次批量执行：同一脚本下发到一个分组或一组选定的系统"""
+    id = db.Column(db.Integer, primary_key=True)
+    script_id = db.Column(db.Integer, db.ForeignKey('script.id'), nullable=False)
+    requested_by_id = db.Column(db.Integer, db.ForeignKey('platform_users.id'), nullable=False)
+    group_id = db.Column(db.Integer, db.ForeignKey('group.id'), nullable=True)  # 为空表示按勾选的系统下发
+    schedule_id = db.Column(db.Integer, db.ForeignKey('job_schedule.id'), nullable=True)  # 由定时计划生成时非空
+    target_count = db.Column(db.Integer, default=0, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    script = db.relationship('Script')
+    requester = db.relationship('User')
+    group = db.relationship('Group')
+    jobs = db.relationship('Job', backref='broadcast', lazy='dynamic')
+
+    def status_counts(self):
+        """各状态的任务数，一次 GROUP BY 查询"""
+        counts = {'pending': 0, 'running': 0, 'completed': 0, 'failed': 0}
+        rows = (db.session.query(Job.status, db.func.count(Job.id))
+                .filter(Job.broadcast_id == self.id).group_by(Job.status).all())
+        for status, count in rows:
+            counts[status] = count
+        return counts
+
+
+class JobSchedule(db.Model):
+    """定时执行计划：按 cron 表达式把脚本下发到一个分组或一组系统"""
+    __tablename__ = 'job_schedule'
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)
+    script_id = db.Column(db.Integer, db.ForeignKey('script.id'), nullable=False)
+    group_id = db.Column(db.Integer, db.ForeignKey('group.id'), nullable=True)
+    system_ids = db.Column(db.Text, nullable=True)  # 逗号分隔；group_id 为空时使用
+    cron = db.Column(db.String(100), nullable=False)  # 5 段 cron 表达式 (UTC)
+    jitter_seconds = db.Column(db.Integer, default=0, nullable=False)  # 任务在该时间窗口内随机错峰
+    is_enabled = db.Column(db.Boolean, default=True, nullable=False)
+    next_run_at = db.Column(db.DateTime, nullable=True, index=True)
+    last_run_at = db.Column(db.DateTime, nullable=True)
+    created_by_id = db.Column(db.Integer, db.ForeignKey('platform_users.id'), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    script = db.relationship('Script')
+    group = db.relationship('Group')
+    creator = db.relationship('User')
+    broadcasts = db.relationship('Broadcast', backref='schedule', lazy='dynamic')
+
+    @property
+    def system_id_list(self):
+        return [int(i) for i in (self.system_ids or '').split(',') if i.strip().isdigit()]
+
+
+class SchedulerLease(db.Model):
+    """调度器主节点租约：多个 worker 中只有持有未过期租约的一个会生成定时任务"""
+    __tablename__ = 'scheduler_lease'
+    name = db.Column(db.String(50), primary_key=True)
+    holder = db.Column(db.String(100), nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False)
+
+
+class JobOutputChunk(db.Model):
+    __tablename__ = 'job_output_chunk'
+    id = db.Column(db.Integer, primary_key=True)
+    job_id = db.Column(db.Integer, db.ForeignKey('job.id'), nullable=False, index=True)
+    offset = db.Column(db.Integer, nullable=False)   # 该块在完整输出中的起始位置 (字符数)
+    length = db.Column(db.Integer, nullable=False)   # 该块的字符数
+    data = db.Column(db.LargeBinary(length=2**24 - 1), nullable=False)  # zlib 压缩的 UTF-8 文本
+
+    @classmethod
+    def from_text(cls, text, offset):
+        return cls(offset=offset, length=len(text), data=zlib.compress(text.encode('utf-8'), 6))
+
+    @property
+    def text(self):
+        return zlib.decompress(self.data).decode('utf-8')
+
+
+class SystemInventory(db.Model):
+    """系统硬件/软件信息快照，由 app.inventory 从清单脚本的输出中解析。
+
+    只在字段值变化时新增一行；每个系统最多一行 is_current=True。
+    """
+    __tablename__ = 'system_inventory'
+    __table_args__ = (
+        db.Index('ix_system_inventory_system_current', 'system_id', 'is_current'),
+        # 全局查询: WHERE is_current AND ram_gb < ?
+        db.Index('ix_system_inventory_current_ram', 'is_current', 'ram_gb'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    system_id = db.Column(db.Integer, db.ForeignKey('system.id'), nullable=False)
+    job_id = db.Column(db.Integer, nullable=True)  # 最近一次确认该快照的任务 (任务可能已归档，不设外键)
+    os_name = db.Column(db.String(200), nullable=True)
+    manufacturer = db.Column(db.String(100), nullable=True)
+    model = db.Column(db.String(100), nullable=True)
+    # 定点小数 (MySQL 的 FLOAT 是单精度，15.9 读回为 15.8999996…，变化检测会失效)
+    ram_gb = db.Column(db.Numeric(6, 1, asdecimal=False), nullable=True)
+    is_current = db.Column(db.Boolean, default=True, nullable=False)
+    collected_at = db.Column(db.DateTime, default=datetime.utcnow)   # 首次采集到这组值的时间
+    confirmed_at = db.Column(db.DateTime, default=datetime.utcnow)   # 最近一次采集到相同值的时间
+    system = db.relationship('System', backref=db.backref('inventory_snapshots', lazy='dynamic'))
+
+
+class JobArchive(db.Model):
+    """归档的历史任务。
+
+    由 app.retention 从 job 表批量迁入，不设外键：系统或脚本删除后归档仍然保留，
+    并冗余保存当时的计算机名和脚本名；输出合并为一个 zlib 压缩块。
+    """
+    __tablename__ = 'job_archive'
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)  # 沿用原 job.id
+    system_id = db.Column(db.Integer, nullable=False, index=True)
+    script_id = db.Column(db.Integer, nullable=False)
+    requested_by_id = db.Column(db.Integer, nullable=False)
+    broadcast_id = db.Column(db.Integer, nullable=True)
+    computer_name = db.Column(db.String(100), nullable=True)
+    script_name = db.Column(db.String(100), nullable=True)
+    status = db.Column(db.String(20), nullable=False)
+    created_at = db.Column(db.DateTime, nullable=True)
+    started_at = db.Column(db.DateTime, nullable=True)
+    completed_at = db.Column(db.DateTime, nullable=True, index=True)
+    output_size = db.Column(db.Integer, default=0, nullable=False)
+    output_data = db.Column(db.LargeBinary(length=2**24 - 1), nullable=True)  # zlib 压缩的 UTF-8 文本
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    @property
+    def output(self):
+        return zlib.decompress(self.output_data).decode('utf-8') if self.output_data else ''
 
 class MenjinDeletionRequest(db.Model):
     __tablename__ = 'menjin_deletion_requests'
@@ -304,6 +611,51 @@ class PendingSystem(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     system_name = db.Column(db.String(150), nullable=False)
     computer_name = db.Column(db.String(100), unique=True, nullable=False, index=True)
+    # 规范化的计算机名，作为注册 upsert 的唯一键 (大小写或末尾的点不同视为同一台主机)
+    hostname_key = db.Column(db.String(100), unique=True, nullable=True, index=True)
     ip_address = db.Column(db.String(255), nullable=True)
     first_seen = db.Column(db.DateTime, default=datetime.utcnow)
     status = db.Column(db.String(20), default='pending', index=True)
+    # 按 IP 自动匹配到的已有系统 (计算机名不同，可能是改名或重装)
+    matched_system_id = db.Column(db.Integer, db.ForeignKey('system.id'), nullable=True)
+    match_reason = db.Column(db.String(20), nullable=True)
+    matched_system = db.relationship('System')
+
+    @validates('computer_name')
+    def _sync_hostname_key(self, key, value):
+        self.hostname_key = normalize_hostname(value)
+        return value
+
+    @staticmethod
+    def split_ips(ip_address):
+        return [ip.strip() for ip in (ip_address or '').split(',') if ip.strip()]
+
+    @classmethod
+    def upsert(cls, values):
+        """按 hostname_key 插入或更新一条记录 (单条语句，重复注册不会产生竞争)。
+
+        MySQL 使用 INSERT ... ON DUPLICATE KEY UPDATE，SQLite 使用 ON CONFLICT DO UPDATE。
+        """
+        dialect = db.session.get_bind().dialect.name
+        update_columns = ('system_name', 'computer_name', 'ip_address', 'first_seen',
+                          'matched_system_id', 'match_reason')
+        if dialect == 'mysql':
+            from sqlalchemy.dialects.mysql import insert
+            statement = insert(cls.__table__).values(**values)
+            statement = statement.on_duplicate_key_update(
+                **{column: statement.inserted[column] for column in update_columns})
+        elif dialect == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert
+            statement = insert(cls.__table__).values(**values)
+            statement = statement.on_conflict_do_update(
+                index_elements=['hostname_key'],
+                set_={column: statement.excluded[column] for column in update_columns})
+        else:
+            existing = cls.query.filter_by(hostname_key=values['hostname_key']).first()
+            if existing:
+                for column in update_columns:
+                    setattr(existing, column, values[column])
+            else:
+                db.session.add(cls(**values))
+            return
+        db.session.execute(statement)
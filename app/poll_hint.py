@@ -0,0 +1,114 @@
+# app/poll_hint.py
+"""
+服务器下发的 Agent 心跳间隔建议 (heartbeat 响应中的 next_poll_seconds)。
+
+建议值按以下顺序决定，再乘以当前负载系数并限制在 [AGENT_POLL_MIN_SECONDS, AGENT_POLL_MAX_SECONDS]：
+  - 本次领到了任务，或本次是长轮询心跳：0 (立即再次心跳)。新任务通知只能唤醒正挂起在
+    长轮询中的 Agent，长轮询的 Agent 若再睡上几分钟，新任务就要等到它醒来才能被领取；
+  - 该主机还有等待错峰窗口的任务：到最早的 not_before 为止；
+  - 最近 AGENT_POLL_ACTIVE_WINDOW_SECONDS 内管理员操作过该系统：AGENT_POLL_ACTIVE_SECONDS；
+  - 其余空闲主机：AGENT_POLL_IDLE_SECONDS。
+负载系数 = 本进程最近一分钟的心跳速率 / AGENT_POLL_TARGET_HEARTBEATS_PER_SECOND (不小于 1)，
+服务器繁忙时整个集群自动放慢。
+
+管理员活动写入 System.last_admin_activity_at，同一系统每 AGENT_ADMIN_ACTIVITY_WRITE_SECONDS
+最多写一次，频繁刷新页面不会产生大量写事务。
+"""
+import random
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta
+
+
+class HeartbeatRate:
+    """本进程的心跳速率 (按秒分桶的滑动窗口)"""
+
+    def __init__(self, window=60):
+        self.window = window
+        self._lock = threading.Lock()
+        self._buckets = deque()  # [(秒, 次数), ...]
+
+    def _trim(self, now):
+        while self._buckets and self._buckets[0][0] <= now - self.window:
+            self._buckets.popleft()
+
+    def hit(self):
+        now = int(time.monotonic())
+        with self._lock:
+            if self._buckets and self._buckets[-1][0] == now:
+                self._buckets[-1][1] += 1
+            else:
+                self._buckets.append([now, 1])
+            self._trim(now)
+
+    def per_second(self):
+        now = int(time.monotonic())
+        with self._lock:
+            self._trim(now)
+            return sum(count for _, count in self._buckets) / self.window
+
+
+heartbeat_rate = HeartbeatRate()
+
+
+def load_factor(config):
+    target = config.get('AGENT_POLL_TARGET_HEARTBEATS_PER_SECOND')
+    if not target:
+        return 1.0
+    return max(1.0, heartbeat_rate.per_second() / target)
+
+
+def next_poll_seconds(system_id, config, last_admin_activity_at=None, claimed=False, long_poll=False):
+    """计算该主机下一次心跳前应等待的秒数 (放慢只作用于不使用长轮询的 Agent)"""
+    from app import db
+    from app.models import Job
+
+    if claimed or long_poll:
+        return 0
+    now = datetime.utcnow()
+    minimum = config.get('AGENT_POLL_MIN_SECONDS', 5)
+    maximum = config.get('AGENT_POLL_MAX_SECONDS', 600)
+    active_window = timedelta(seconds=config.get('AGENT_POLL_ACTIVE_WINDOW_SECONDS', 900))
+
+    if last_admin_activity_at is not None and now - last_admin_activity_at < active_window:
+        hint = config.get('AGENT_POLL_ACTIVE_SECONDS', 5)
+    else:
+        hint = config.get('AGENT_POLL_IDLE_SECONDS', 120)
+    # 队列深度：还有未领取的任务时不能睡过头 (由 job 的 system_id/status 索引支撑)
+    pending_count, earliest = (db.session.query(db.func.count(Job.id), db.func.min(Job.not_before))
+                               .filter(Job.system_id == system_id, Job.status == 'pending').one())
+    if pending_count:
+        hint = min(hint, (earliest - now).total_seconds() if earliest and earliest > now else 0)
+
+    hint *= load_factor(config)
+    # ±10% 抖动，避免同时启动的主机一直同步心跳
+    hint *= random.uniform(0.9, 1.1)
+    return int(round(min(max(hint, minimum), maximum)))
+
+
+class AdminActivity:
+    """节流写入 System.last_admin_activity_at"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._written = {}  # system_id → 本进程最近一次写入的 monotonic 时间
+
+    def touch(self, system_id, min_interval=60):
+        """记录管理员正在操作该系统 (需要时执行一条 UPDATE 并提交)，返回是否写入"""
+        from app import db
+        from app.models import System
+
+        now = time.monotonic()
+        with self._lock:
+            last = self._written.get(system_id)
+            if last is not None and now - last < min_interval:
+                return False
+            self._written[system_id] = now
+        System.query.filter(System.id == system_id).update(
+            {'last_admin_activity_at': datetime.utcnow()}, synchronize_session=False)
+        db.session.commit()
+        return True
+
+
+admin_activity = AdminActivity()
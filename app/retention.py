@@ -0,0 +1,75 @@
+# app/retention.py
+"""
+任务历史保留策略。
+
+已结束 (completed / failed) 且完成时间早于 JOB_RETENTION_DAYS 天的任务，
+按主键分批迁入 job_archive，并从 job / job_output_chunk 中删除。
+每批一个短事务，只锁定本批的行，心跳领取任务和执行面板不会被长时间阻塞；
+job 表的大小因此只与保留期内的任务量有关。
+"""
+import time
+import zlib
+from datetime import datetime, timedelta
+
+FINISHED_STATUSES = ('completed', 'failed')
+
+
+def _archive_batch(job_ids):
+    """把一批任务迁入归档表 (单个事务)"""
+    from app import db
+    from app.models import Job, JobArchive, JobOutputChunk, System, Script
+
+    rows = (db.session.query(Job, System.computer_name, Script.name)
+            .outerjoin(System, System.id == Job.system_id)
+            .outerjoin(Script, Script.id == Job.script_id)
+            .filter(Job.id.in_(job_ids)).all())
+    # 一次查询取回本批全部输出分块，按任务拼接后重新压缩为单块
+    outputs = {}
+    for job_id, data in (db.session.query(JobOutputChunk.job_id, JobOutputChunk.data)
+                         .filter(JobOutputChunk.job_id.in_(job_ids))
+                         .order_by(JobOutputChunk.job_id, JobOutputChunk.offset)):
+        outputs.setdefault(job_id, []).append(zlib.decompress(data))
+
+    archived = [{'id': job.id, 'system_id': job.system_id, 'script_id': job.script_id,
+                 'requested_by_id': job.requested_by_id, 'broadcast_id': job.broadcast_id,
+                 'computer_name': computer_name, 'script_name': script_name, 'status': job.status,
+                 'created_at': job.created_at, 'started_at': job.started_at, 'completed_at': job.completed_at,
+                 'output_size': job.output_size or 0,
+                 'output_data': zlib.compress(b''.join(outputs[job.id]), 6) if job.id in outputs else None,
+                 'archived_at': datetime.utcnow()}
+                for job, computer_name, script_name in rows]
+    if archived:
+        db.session.execute(JobArchive.__table__.insert().values(archived))
+    ids = [row['id'] for row in archived]
+    JobOutputChunk.query.filter(JobOutputChunk.job_id.in_(ids)).delete(synchronize_session=False)
+    Job.query.filter(Job.id.in_(ids), Job.status.in_(FINISHED_STATUSES)).delete(synchronize_session=False)
+    db.session.commit()
+    return len(ids)
+
+
+def archive_old_jobs(days, batch_size=500, max_batches=None, pause=0.0):
+    """归档 days 天前结束的任务，返回归档的任务数。
+
+    max_batches 限制本次最多处理的批数 (后台定期执行时避免单次占用太久)；
+    pause 为两批之间的间隔秒数，给在线请求让出数据库。
+    """
+    from app import db
+    from app.models import Job
+
+    cutoff = datetime.utcnow() - timedelta(days=days)
+    total, batches = 0, 0
+    while max_batches is None or batches < max_batches:
+        job_ids = [job_id for (job_id,) in db.session.query(Job.id)
+                   .filter(Job.status.in_(FINISHED_STATUSES), Job.completed_at < cutoff)
+                   .order_by(Job.id).limit(batch_size)]
+        if not job_ids:
+            break
+        try:
+            total += _archive_batch(job_ids)
+        except Exception:
+            db.session.rollback()
+            raise
+        batches += 1
+        if pause:
+            time.sleep(pause)
+    return total
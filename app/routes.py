@@ -1,23 +1,40 @@
 # app/routes.py
-from flask import render_template, flash, redirect, url_for, request, Blueprint, jsonify
+from flask import (render_template, flash, redirect, url_for, request, Blueprint, jsonify, current_app, abort,
+                   Response, stream_with_context)
 from flask_login import current_user, login_user, logout_user, login_required
 from app import db
 from app.models import (User, System, SystemAccount, CheckHistory, SystemUser, WorkstationUser, 
                         SystemRole, DisableRequest, Group, Script, Job, UserRequest,RoleChangeRequest,
                         MenjinDeletionRequest, PartialDisableRequest,MenjinPrivilegeDeletionRequest,
-                        PendingSystem)
+                        PendingSystem, ScriptVersion, Broadcast, JobSchedule, SystemInventory, AccessMatrix)
+from app.job_signals import job_hub, new_job_watcher, notify_system_jobs, notify_job_update
+from app.hostname_index import hostname_index, normalize_hostname
+from app.system_onboarding import register_pending_system, promote_pending_systems
+from app.scheduler import CronExpression
+from app.inventory import INVENTORY_PARSERS, record_inventory
+from app.account_sync import reconcile_system_accounts
+from app.agent_presence import last_seen_buffer, is_agent_online
+from app.account_search import account_search, account_search_filter
+from app.access_matrix import mark_links_changed, mark_accounts_changed
+from app.access_export import EXPORT_FORMATS, export_rows, iter_csv, iter_xlsx, export_filename
+from app.poll_hint import heartbeat_rate, next_poll_seconds, admin_activity
 from app.forms import (LoginForm, SearchUserForm, EditSystemForm, AssignGroupForm, 
                        AddSystemForm, GroupForm, ScriptForm, ExecuteJobForm,
                        UserRequestForm, AdminUserForm, AddComputerUserForm, 
-                       AddWorkstationUserForm, BatchImportForm,RoleChangeRequestForm)
+                       AddWorkstationUserForm, BatchImportForm,RoleChangeRequestForm, JobScheduleForm)
 from sqlalchemy import case
 from datetime import date, timedelta, datetime
 from functools import wraps
-from sqlalchemy import or_
+from sqlalchemy import or_, and_
+from sqlalchemy.orm import joinedload
 from flask import session
 from collections import defaultdict
 from dateutil.relativedelta import relativedelta
+import base64
 import json
+import time
+import gzip
+import zlib
 
 
 bp = Blueprint('routes', __name__)
@@ -123,6 +140,9 @@ def it_check_manage():
 @roles_required('admin', 'qc')
 def system_detail(system_id):
     system = System.query.get_or_404(system_id)
+    if current_user.role == 'admin':
+        # 管理员正在查看该系统：让它的 Agent 在接下来一段时间内加快心跳
+        admin_activity.touch(system.id, current_app.config.get('AGENT_ADMIN_ACTIVITY_WRITE_SECONDS', 60))
     scripts = Script.query.order_by(Script.name).all()
     form_computer = AddComputerUserForm() if current_user.role == 'admin' else None
     form_workstation = AddWorkstationUserForm() if current_user.role == 'admin' else None
@@ -162,8 +182,10 @@ def system_detail(system_id):
                 flash('工作站用户已成功添加。', 'success')
             return redirect(url_for('routes.system_detail', system_id=system.id))
 
+    inventory = SystemInventory.query.filter_by(system_id=system.id, is_current=True).first()
     return render_template('system_detail.html', title=system.name, system=system, scripts=scripts,
-                           add_sys_user_form=form_computer, add_ws_user_form=form_workstation,execute_form=execute_form)
+                           add_sys_user_form=form_computer, add_ws_user_form=form_workstation,execute_form=execute_form,
+                           inventory=inventory)
 
 @bp.route('/system/enable_user_link/<link_type>/<int:link_id>', methods=['POST'])
 @login_required
@@ -335,69 +357,134 @@ def qa_dashboard():
                            systems=systems, today=date.today(),
                            all_groups=all_groups, current_group_id=group_filter_id, 
                            sort_by=sort_by)
+def encode_directory_cursor(key):
+    """把 (中文名, 用户名) 编码为不透明的游标字符串"""
+    return base64.urlsafe_b64encode(json.dumps(key, ensure_ascii=False).encode('utf-8')).decode('ascii')
+
+def decode_directory_cursor(cursor):
+    """解析游标，无效时返回 None (从第一页开始)"""
+    try:
+        chinese_name, username = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8'))
+    except (ValueError, TypeError, UnicodeError):
+        return None
+    if not isinstance(chinese_name, str) or not isinstance(username, str):
+        return None
+    return chinese_name, username
+
+def load_user_directory(search_term='', after=None, limit=100):
+    """按 (中文名, 用户名) 顺序取一页至少有一条活动权限的账户，以及这些账户的活动权限。
+
+    after 为上一页最后一个账户的 (中文名, 用户名)。每页固定 2 条查询，都只读访问矩阵
+    (活动权限的账户按游标定位、本页账户的活动权限)。
+    返回 (accounts_by_person, 下一页的游标键或 None)，其中
+    accounts_by_person = {中文名: [{'username': ..., 'systems': {'编号 - 系统名': {'computer': [角色], 'workstation': [角色]}}}]}
+    """
+    account_query = (db.session.query(AccessMatrix.account_id, AccessMatrix.chinese_name, AccessMatrix.username)
+                     .filter(AccessMatrix.is_active.is_(True)).distinct())
+    if search_term:
+        # 先查进程内索引 (含拼音和首字母)；没有命中 (其他 worker 新增/改名的账户要等索引过期才可见)
+        # 或命中过多的宽泛搜索词退回 SQL 条件
+        max_ids = current_app.config.get('ACCOUNT_SEARCH_MAX_IDS', 2000)
+        matched_ids = account_search.search(search_term, limit=max_ids + 1)
+        if matched_ids and len(matched_ids) <= max_ids:
+            account_query = account_query.filter(AccessMatrix.account_id.in_(matched_ids))
+        else:
+            account_query = account_query.filter(AccessMatrix.account_id.in_(
+                db.session.query(SystemAccount.id).filter(account_search_filter(search_term))))
+    if after:
+        # 展开的行比较，MySQL 可以直接在 (is_active, chinese_name, username) 索引上做范围扫描
+        account_query = account_query.filter(or_(
+            AccessMatrix.chinese_name > after[0],
+            and_(AccessMatrix.chinese_name == after[0], AccessMatrix.username > after[1])))
+    rows = account_query.order_by(AccessMatrix.chinese_name, AccessMatrix.username).limit(limit + 1).all()
+    next_key = (rows[limit - 1].chinese_name, rows[limit - 1].username) if len(rows) > limit else None
+    rows = rows[:limit]
+
+    systems_by_account = defaultdict(lambda: defaultdict(lambda: {'computer': [], 'workstation': []}))
+    account_ids = [row.account_id for row in rows]
+    if account_ids:
+        # 'computer' < 'workstation'，与原先先列电脑用户、再列工作站用户的顺序一致
+        links = (db.session.query(AccessMatrix.account_id, AccessMatrix.link_type, AccessMatrix.system_number,
+                                  AccessMatrix.system_name, AccessMatrix.role)
+                 .filter(AccessMatrix.account_id.in_(account_ids), AccessMatrix.is_active.is_(True))
+                 .order_by(AccessMatrix.link_type, AccessMatrix.link_id))
+        for account_id, link_type, system_number, system_name, role in links:
+            systems_by_account[account_id][f"{system_number} - {system_name}"][link_type].append(role)
+
+    accounts_by_person = defaultdict(list)
+    for account_id, chinese_name, username in rows:
+        accounts_by_person[chinese_name].append({
+            'username': username,
+            'systems': dict(systems_by_account.get(account_id, {})),
+        })
+    return accounts_by_person, next_key
+
 @bp.route('/user_directory')
 @login_required
 @roles_required('admin', 'qc')
 def user_directory():
-    """全系统用户目录 - 按中文名归集显示"""
+    """全系统用户目录 - 按中文名归集显示 (首屏只渲染第一页，其余由前端滚动加载)"""
     search_term = request.args.get('search', '').strip()
-    query = SystemAccount.query
-    if search_term:
-        query = query.filter(or_(SystemAccount.username.ilike(f'%{search_term}%'), SystemAccount.chinese_name.ilike(f'%{search_term}%')))
-    
-    # 查询出所有符合条件的账户，并按中文名和用户名排序
-    accounts = query.order_by(SystemAccount.chinese_name, SystemAccount.username).all()
-
-    # --- 核心修改：在后端按中文名对账户进行分组 ---
-    accounts_by_person = defaultdict(list)
-    for acc in accounts:
-        # 确保只显示那些至少在一个系统中有权限的账户
-        if acc.system_access.filter_by(is_active=True).first() or acc.workstation_access.filter_by(is_active=True).first():
-            accounts_by_person[acc.chinese_name].append(acc)
-
+    accounts_by_person, next_key = load_user_directory(search_term, limit=current_app.config['USER_DIRECTORY_PAGE_SIZE'])
+    # 导出表单的分组/系统筛选项
+    groups = Group.query.order_by(Group.name).all()
+    systems = db.session.query(System.id, System.system_number, System.name).order_by(System.system_number).all()
     return render_template('user_directory.html', title='全系统用户目录', 
                            accounts_by_person=accounts_by_person, # 传递分组后的字典
-                           search_term=search_term)
+                           next_cursor=encode_directory_cursor(next_key) if next_key else None,
+                           search_term=search_term, groups=groups, systems=systems)
 @bp.route('/api/system_accounts')
 @login_required
 @roles_required('admin', 'qc')
 def api_get_system_accounts():
+    """用户目录的一页数据：?search=&cursor=&limit=，返回 {'people': [...], 'next_cursor': ...}"""
     search_term = request.args.get('search', '').strip()
-    
-    query = SystemAccount.query
-    if search_term:
-        query = query.filter(or_(SystemAccount.username.ilike(f'%{search_term}%'), SystemAccount.chinese_name.ilike(f'%{search_term}%')))
-    
-    accounts = query.order_by(SystemAccount.chinese_name, SystemAccount.username).all()
+    cursor = request.args.get('cursor')
+    after = decode_directory_cursor(cursor) if cursor else None
+    if cursor and after is None:
+        return jsonify({'error': 'Invalid cursor'}), 400
+    page_size = current_app.config['USER_DIRECTORY_PAGE_SIZE']
+    limit = max(1, min(request.args.get('limit', page_size, type=int), page_size * 5))
+    accounts_by_person, next_key = load_user_directory(search_term, after=after, limit=limit)
+    # 同一个人的账户可能跨页，前端按 chinese_name 与上一页的最后一组合并
+    return jsonify({
+        'people': [{'chinese_name': chinese_name, 'accounts': accounts}
+                   for chinese_name, accounts in accounts_by_person.items()],
+        'next_cursor': encode_directory_cursor(next_key) if next_key else None,
+    })
 
-    # 将数据处理成前端需要的 JSON 格式
-    results = []
-    # 按中文名分组
-    accounts_by_person = defaultdict(list)
-    for acc in accounts:
-        if acc.system_access.filter_by(is_active=True).first() or acc.workstation_access.filter_by(is_active=True).first():
-            accounts_by_person[acc.chinese_name].append(acc)
-
-    # 构造成 JSON
-    for chinese_name, acc_list in accounts_by_person.items():
-        person_data = {
-            'chinese_name': chinese_name,
-            'accounts': []
-        }
-        for acc in acc_list:
-            systems_map = defaultdict(lambda: {'computer': [], 'workstation': []})
-            for su in acc.system_access.filter_by(is_active=True):
-                systems_map[f"{su.system.system_number} - {su.system.name}"]['computer'].append(su.system_role)
-            for wu in acc.workstation_access.filter_by(is_active=True):
-                 systems_map[f"{wu.system.system_number} - {wu.system.name}"]['workstation'].append(wu.role.name)
-
-            person_data['accounts'].append({
-                'username': acc.username,
-                'systems': dict(systems_map)
-            })
-        results.append(person_data)
-        
-    return jsonify(results)
+def _access_export_response(prefix, sheet_title, include_inactive=False, **filters):
+    """按 ?format=csv|xlsx 流式导出访问矩阵中符合条件的行"""
+    export_format = request.args.get('format', 'csv').lower()
+    if export_format not in EXPORT_FORMATS:
+        abort(400)
+    rows = export_rows(include_inactive=include_inactive,
+                       batch_size=current_app.config.get('ACCESS_EXPORT_BATCH_SIZE', 1000), **filters)
+    body = iter_csv(rows) if export_format == 'csv' else iter_xlsx(rows, sheet_title=sheet_title)
+    return Response(stream_with_context(body), mimetype=EXPORT_FORMATS[export_format],
+                    headers={'Content-Disposition': export_filename(prefix, export_format),
+                             'X-Accel-Buffering': 'no'})
+
+@bp.route('/user_directory/export')
+@login_required
+@roles_required('admin', 'qc')
+def export_user_directory():
+    """导出全系统用户目录：?format=csv|xlsx&group=&system=&include_inactive=1"""
+    group_id = request.args.get('group', 0, type=int)
+    system_id = request.args.get('system', 0, type=int)
+    return _access_export_response('access_directory', '系统用户目录',
+                                   include_inactive=request.args.get('include_inactive', 0, type=int) == 1,
+                                   group_id=group_id, system_id=system_id)
+
+@bp.route('/system/<int:system_id>/users/export')
+@login_required
+@roles_required('admin', 'qc')
+def export_system_users(system_id):
+    """导出单个系统的用户清单 (含已禁用用户，可用 include_inactive=0 排除)"""
+    system = System.query.get_or_404(system_id)
+    return _access_export_response(f'system_users_{system.system_number}', '系统用户清单',
+                                   include_inactive=request.args.get('include_inactive', 1, type=int) == 1,
+                                   system_id=system.id)
 # --- 认证路由 ---
 
 @bp.route('/login', methods=['GET', 'POST'])
@@ -784,9 +871,11 @@ def approve_partial_disable_request(request_id):
     if comp_links_info:
         ids_to_disable = [link['id'] for link in comp_links_info]
         disabled_count += SystemUser.query.filter(SystemUser.id.in_(ids_to_disable)).update({'is_active': False}, synchronize_session=False)
+        mark_links_changed('computer', ids_to_disable)
     if ws_links_info:
         ids_to_disable = [link['id'] for link in ws_links_info]
         disabled_count += WorkstationUser.query.filter(WorkstationUser.id.in_(ids_to_disable)).update({'is_active': False}, synchronize_session=False)
+        mark_links_changed('workstation', ids_to_disable)
     req.status = 'completed'
     db.session.commit()
     flash(f'已为用户 “{req.chinese_name}” 成功禁用了 {disabled_count} 项系统权限。', 'success')
@@ -881,6 +970,7 @@ def approve_disable_request(request_id):
     # 核心修正：添加 synchronize_session=False 参数
     SystemUser.query.filter_by(account_id=account_to_disable.id).update({'is_active': False}, synchronize_session=False)
     WorkstationUser.query.filter_by(account_id=account_to_disable.id).update({'is_active': False}, synchronize_session=False)
+    mark_accounts_changed([account_to_disable.id])
     
     req.status = 'completed'
     db.session.commit()
@@ -1006,6 +1096,7 @@ def edit_system(system_id):
         
         try:
             db.session.commit()
+            hostname_index.invalidate()
             flash('系统信息已成功更新！', 'success')
             return redirect(url_for('routes.system_detail', system_id=system.id))
         except Exception as e:
@@ -1066,7 +1157,11 @@ def delete_group(group_id):
     group_to_delete = Group.query.get_or_404(group_id)
     if group_to_delete.systems.first():
         flash(f'无法删除分组 "{group_to_delete.name}"，因为它仍被系统使用。', 'danger')
+    elif JobSchedule.query.filter_by(group_id=group_to_delete.id).first():
+        flash(f'无法删除分组 "{group_to_delete.name}"，因为它仍被定时计划引用。', 'danger')
     else:
+        # 历史广播保留，只解除与分组的关联
+        Broadcast.query.filter_by(group_id=group_to_delete.id).update({'group_id': None}, synchronize_session=False)
         db.session.delete(group_to_delete)
         db.session.commit()
         flash(f'分组 "{group_to_delete.name}" 已成功删除。', 'success')
@@ -1091,9 +1186,19 @@ def toggle_qa_check_need(system_id):
 def execute_dashboard():
     systems = System.query.filter(System.computer_name.isnot(None), System.computer_name != '').order_by(System.name).all()
     scripts = Script.query.order_by(Script.name).all()
-    recent_jobs = Job.query.order_by(Job.created_at.desc()).limit(20).all()
-    latest_jobs = {s.id: Job.query.filter_by(system_id=s.id).order_by(Job.created_at.desc()).first() for s in systems}
-    return render_template('execute_dashboard.html', title='远程脚本执行', systems=systems, scripts=scripts, recent_jobs=recent_jobs, latest_jobs=latest_jobs)
+    recent_jobs = (Job.query.options(joinedload(Job.system), joinedload(Job.script))
+                   .order_by(Job.created_at.desc()).limit(20).all())
+    # 每个系统的最新任务：自增 id 与创建顺序一致，一次 GROUP BY 取 MAX(id)，
+    # 由 (system_id, id) 索引支撑，查询次数与系统数量无关
+    latest_job_ids = db.session.query(db.func.max(Job.id)).group_by(Job.system_id)
+    latest_jobs = {job.system_id: job for job in Job.query.filter(Job.id.in_(latest_job_ids)).all()}
+    offline_after = current_app.config['AGENT_OFFLINE_AFTER_SECONDS']
+    agent_online = {system.id: is_agent_online(system, offline_after) for system in systems}
+    groups = Group.query.order_by(Group.name).all()
+    recent_broadcasts = (Broadcast.query.options(joinedload(Broadcast.script), joinedload(Broadcast.group))
+                         .order_by(Broadcast.id.desc()).limit(5).all())
+    return render_template('execute_dashboard.html', title='远程脚本执行', systems=systems, scripts=scripts, recent_jobs=recent_jobs, latest_jobs=latest_jobs,
+                           groups=groups, recent_broadcasts=recent_broadcasts, agent_online=agent_online)
 
 @bp.route('/admin/scripts', methods=['GET', 'POST'])
 @login_required
@@ -1125,6 +1230,8 @@ def edit_script(script_id):
         if existing_script and existing_script.id != script_id:
             flash('该脚本名称已被其他脚本使用。', 'danger')
         else:
+            if script.content != form.content.data:
+                ScriptVersion.archive(script)
             script.name, script.description, script.content = new_name, form.description.data.strip(), form.content.data
             db.session.commit()
             flash('脚本已成功更新。', 'success')
@@ -1138,12 +1245,67 @@ def delete_script(script_id):
     script = Script.query.get_or_404(script_id)
     if Job.query.filter_by(script_id=script.id).first():
         flash('无法删除此脚本，因为它已被用于执行任务。', 'danger')
+    elif JobSchedule.query.filter_by(script_id=script.id).first():
+        flash('无法删除此脚本，因为它已被定时计划引用。', 'danger')
+    elif Broadcast.query.filter_by(script_id=script.id).first():
+        # 任务归档后 Job 记录可能已不存在，但广播记录仍引用该脚本
+        flash('无法删除此脚本，因为它已被用于批量下发任务。', 'danger')
     else:
         db.session.delete(script)
         db.session.commit()
         flash('脚本已成功删除。', 'success')
     return redirect(url_for('routes.manage_scripts'))
 
+@bp.route('/admin/schedules', methods=['GET', 'POST'])
+@login_required
+@roles_required('admin')
+def manage_schedules():
+    form = JobScheduleForm()
+    form.script.choices = [(s.id, s.name) for s in Script.query.order_by(Script.name).all()]
+    form.group.choices = [(0, '不按分组 (使用下方选择的系统)')] + [(g.id, g.name) for g in Group.query.order_by(Group.name).all()]
+    form.systems.choices = [(s.id, f'{s.name} ({s.computer_name})') for s in
+                            System.query.filter(System.computer_name.isnot(None), System.computer_name != '')
+                            .order_by(System.name).all()]
+    if form.validate_on_submit():
+        cron = CronExpression(form.cron.data)
+        schedule = JobSchedule(name=form.name.data.strip(), script_id=form.script.data,
+                               group_id=form.group.data or None,
+                               system_ids=None if form.group.data else ','.join(str(i) for i in form.systems.data),
+                               cron=cron.expr, jitter_seconds=(form.jitter_minutes.data or 0) * 60,
+                               next_run_at=cron.next_after(datetime.utcnow()), created_by_id=current_user.id)
+        db.session.add(schedule)
+        db.session.commit()
+        flash(f'定时计划已创建，下次执行时间 (UTC): {schedule.next_run_at:%Y-%m-%d %H:%M}。', 'success')
+        return redirect(url_for('routes.manage_schedules'))
+    schedules = (JobSchedule.query.options(joinedload(JobSchedule.script), joinedload(JobSchedule.group))
+                 .order_by(JobSchedule.name).all())
+    return render_template('manage_schedules.html', title='定时计划', form=form, schedules=schedules)
+
+@bp.route('/admin/schedules/<int:schedule_id>/toggle', methods=['POST'])
+@login_required
+@roles_required('admin')
+def toggle_schedule(schedule_id):
+    schedule = JobSchedule.query.get_or_404(schedule_id)
+    schedule.is_enabled = not schedule.is_enabled
+    if schedule.is_enabled:
+        # 重新启用时从当前时间起算，不补跑停用期间错过的执行
+        schedule.next_run_at = CronExpression(schedule.cron).next_after(datetime.utcnow())
+    db.session.commit()
+    flash(f'定时计划“{schedule.name}”已{"启用" if schedule.is_enabled else "停用"}。', 'success')
+    return redirect(url_for('routes.manage_schedules'))
+
+@bp.route('/admin/schedules/<int:schedule_id>/delete', methods=['POST'])
+@login_required
+@roles_required('admin')
+def delete_schedule(schedule_id):
+    schedule = JobSchedule.query.get_or_404(schedule_id)
+    # 保留已生成的批量执行记录，只解除关联
+    Broadcast.query.filter_by(schedule_id=schedule.id).update({'schedule_id': None}, synchronize_session=False)
+    db.session.delete(schedule)
+    db.session.commit()
+    flash('定时计划已删除。', 'success')
+    return redirect(url_for('routes.manage_schedules'))
+
 # --- 数据操作路由 ---
 
 
@@ -1159,6 +1321,7 @@ def add_system():
         new_system = System(name=form.name.data.strip(), system_number=form.system_number.data.strip(), group_id=form.group.data if form.group.data != 0 else None, check_frequency_days=form.check_frequency_days.data, next_check_date=form.next_check_date.data, is_domain_joined=form.is_domain_joined.data, computer_name=form.computer_name.data.strip(), ip_address=form.ip_address.data.strip())
         db.session.add(new_system)
         db.session.commit()
+        hostname_index.invalidate()
         flash('New system has been added successfully!', 'success')
     else:
         for field, errors in form.errors.items():
@@ -1243,8 +1406,12 @@ def delete_system(system_id):
     if Job.query.filter_by(system_id=system.id).first():
         flash(f'无法删除系统 "{system.name}"，因为它存在关联的任务执行记录。', 'danger')
         return redirect(url_for('routes.index'))
+    SystemInventory.query.filter_by(system_id=system.id).delete(synchronize_session=False)
+    PendingSystem.query.filter_by(matched_system_id=system.id).update(
+        {'matched_system_id': None, 'match_reason': None}, synchronize_session=False)
     db.session.delete(system)
     db.session.commit()
+    hostname_index.invalidate()
     flash(f'系统 "{system.name}" 已被成功删除。', 'success')
     return redirect(url_for('routes.it_check_manage'))
 
@@ -1340,8 +1507,10 @@ def assign_group(user_id):
 def cancel_job(job_id):
     job_to_cancel = Job.query.get_or_404(job_id)
     if job_to_cancel.status == 'pending':
+        broadcast_id = job_to_cancel.broadcast_id
         db.session.delete(job_to_cancel)
         db.session.commit()
+        notify_job_update(job_id, broadcast_id)
         flash(f'任务ID {job_id} 已成功取消。', 'success')
     else:
         flash(f'无法取消任务ID {job_id}，因为它已经在运行或已完成。', 'warning')
@@ -1376,35 +1545,39 @@ def get_system_roles_api(system_id):
 @bp.route('/api/user/<string:chinese_name>/access_links')
 @login_required
 def get_user_access_links(chinese_name):
-    accounts = SystemAccount.query.filter_by(chinese_name=chinese_name).all()
-    if not accounts:
+    rows = (db.session.query(AccessMatrix.link_type, AccessMatrix.link_id, AccessMatrix.system_name, AccessMatrix.role)
+            .filter(AccessMatrix.chinese_name == chinese_name)
+            .order_by(AccessMatrix.account_id, AccessMatrix.link_type, AccessMatrix.link_id).all())
+    if not rows and not db.session.query(SystemAccount.query.filter_by(chinese_name=chinese_name).exists()).scalar():
         return jsonify({'error': 'User not found'}), 404
-        
-    computer_links = []
-    workstation_links = []
-    
-    for acc in accounts:
-        for su in acc.system_access:
-            computer_links.append({'id': su.id, 'system_name': su.system.name, 'role': su.system_role})
-        for wu in acc.workstation_access:
-            workstation_links.append({'id': wu.id, 'system_name': wu.system.name, 'role': wu.role.name})
-            
+
+    links = {'computer': [], 'workstation': []}
+    for link_type, link_id, system_name, role in rows:
+        links[link_type].append({'id': link_id, 'system_name': system_name, 'role': role})
+    computer_links, workstation_links = links['computer'], links['workstation']
+
     return jsonify({'computer_links': computer_links, 'workstation_links': workstation_links})
 
 
+def _system_users_for_select(system_id, link_type):
+    """从访问矩阵取某系统的电脑用户或工作站用户，作为下拉框选项"""
+    rows = (db.session.query(AccessMatrix.link_id, AccessMatrix.chinese_name, AccessMatrix.username, AccessMatrix.role)
+            .filter(AccessMatrix.system_id == system_id, AccessMatrix.link_type == link_type)
+            .order_by(AccessMatrix.link_id).all())
+    return [{'id': link_id, 'text': f"{chinese_name} ({username}) - 当前角色: {role}"}
+            for link_id, chinese_name, username, role in rows]
+
 @bp.route('/api/system/<int:system_id>/computer_users_for_select')
 @login_required
 def get_computer_users_for_select(system_id):
     system = System.query.get_or_404(system_id)
-    users = [{'id': su.id, 'text': f"{su.account.chinese_name} ({su.account.username}) - 当前角色: {su.system_role}"} for su in system.system_users]
-    return jsonify(users)
+    return jsonify(_system_users_for_select(system.id, 'computer'))
 
 @bp.route('/api/system/<int:system_id>/workstation_users_for_select')
 @login_required
 def get_workstation_users_for_select(system_id):
     system = System.query.get_or_404(system_id)
-    users = [{'id': wu.id, 'text': f"{wu.account.chinese_name} ({wu.account.username}) - 当前角色: {wu.role.name}"} for wu in system.workstation_users]
-    return jsonify(users)
+    return jsonify(_system_users_for_select(system.id, 'workstation'))
 
 
 @bp.route('/api/system/<int:system_id>/users')
@@ -1412,28 +1585,11 @@ def get_workstation_users_for_select(system_id):
 def get_system_users_api(system_id):
     """API: 获取指定系统下的所有用户及其角色，用于参考显示"""
     system = System.query.get_or_404(system_id)
-    user_map = {}
-    
-    # 汇总电脑用户
-    for su in system.system_users:
-        key = f"{su.account.chinese_name} ({su.account.username})"
-        if key not in user_map:
-            user_map[key] = []
-        user_map[key].append(f"电脑用户: {su.system_role}")
-    
-    # 汇总工作站用户
-    for wu in system.workstation_users:
-        key = f"{wu.account.chinese_name} ({wu.account.username})"
-        if key not in user_map:
-            user_map[key] = []
-        user_map[key].append(f"工作站: {wu.role.name}")
-        
-    # 格式化为最终列表
-    users = [{'name': name, 'roles': roles} for name, roles in user_map.items()]
-    
-    # 为前端JS返回一个更友好的格式
-    # 为了简化，我们只返回工作站用户
-    ws_users = [{'name': wu.account.chinese_name, 'role': wu.role.name} for wu in system.workstation_users]
+    # 前端只显示工作站用户；由访问矩阵的 (system_id, link_type) 索引支撑
+    rows = (db.session.query(AccessMatrix.chinese_name, AccessMatrix.role)
+            .filter(AccessMatrix.system_id == system.id, AccessMatrix.link_type == 'workstation')
+            .order_by(AccessMatrix.link_id).all())
+    ws_users = [{'name': chinese_name, 'role': role} for chinese_name, role in rows]
 
     return jsonify(ws_users)
 
@@ -1445,47 +1601,468 @@ def execute_job(system_id):
     script_id = request.json.get('script_id')
     if not script_id:
         return jsonify({'status': 'error', 'message': 'Script ID not provided.'}), 400
+    admin_activity.touch(system.id, current_app.config.get('AGENT_ADMIN_ACTIVITY_WRITE_SECONDS', 60))
     new_job = Job(system_id=system.id, script_id=script_id, requested_by_id=current_user.id, status='pending')
     db.session.add(new_job)
     db.session.commit()
+    notify_system_jobs(system.id)
     return jsonify({'status': 'success', 'message': f'Job has been created for {system.computer_name}.', 'job_id': new_job.id})
 
+@bp.route('/api/broadcast', methods=['POST'])
+@login_required
+@roles_required('admin')
+def create_broadcast():
+    """把一个脚本下发到整个分组或一组勾选的系统，所有任务用批量 INSERT 一次创建"""
+    data = request.get_json(silent=True) or {}
+    script = Script.query.get(data.get('script_id') or 0)
+    if not script:
+        return jsonify({'status': 'error', 'message': 'Script not found.'}), 400
+    group_id = data.get('group_id') or None
+    system_ids = data.get('system_ids') or []
+    if not group_id and not system_ids:
+        return jsonify({'status': 'error', 'message': 'Please select a group or at least one system.'}), 400
+
+    # 只有填写了计算机名的系统才可能运行 Agent
+    query = db.session.query(System.id).filter(System.computer_name.isnot(None), System.computer_name != '')
+    if group_id:
+        query = query.filter(System.group_id == group_id)
+    else:
+        query = query.filter(System.id.in_([int(i) for i in system_ids if str(i).isdigit()]))
+    target_ids = [row.id for row in query.all()]
+    if not target_ids:
+        return jsonify({'status': 'error', 'message': 'No registered systems in the selection.'}), 400
+
+    broadcast = Broadcast(script_id=script.id, requested_by_id=current_user.id, group_id=group_id,
+                          target_count=len(target_ids))
+    db.session.add(broadcast)
+    db.session.flush()
+    Job.bulk_create(target_ids, script.id, current_user.id, broadcast_id=broadcast.id)
+    db.session.commit()
+    for system_id in target_ids:
+        notify_system_jobs(system_id)
+    return jsonify({'status': 'success', 'message': f'Created {len(target_ids)} jobs.',
+                    'broadcast_id': broadcast.id, 'job_count': len(target_ids)})
+
+@bp.route('/api/broadcast/<int:broadcast_id>/summary')
+@login_required
+@roles_required('admin')
+def broadcast_summary(broadcast_id):
+    broadcast = Broadcast.query.get_or_404(broadcast_id)
+    counts = broadcast.status_counts()
+    finished = counts['completed'] + counts['failed']
+    return jsonify({'broadcast_id': broadcast.id, 'script': broadcast.script.name,
+                    'target_count': broadcast.target_count, 'counts': counts,
+                    'finished': finished >= sum(counts.values())})
+
+@bp.route('/api/inventory')
+@login_required
+@roles_required('admin')
+def query_inventory():
+    """按当前硬件快照筛选系统，例如 /api/inventory?max_ram_gb=8 查询内存小于 8 GB 的主机"""
+    query = (db.session.query(SystemInventory, System.name, System.computer_name)
+             .join(System, System.id == SystemInventory.system_id)
+             .filter(SystemInventory.is_current.is_(True)))
+    max_ram = request.args.get('max_ram_gb', type=float)
+    min_ram = request.args.get('min_ram_gb', type=float)
+    if max_ram is not None:
+        query = query.filter(SystemInventory.ram_gb < max_ram)
+    if min_ram is not None:
+        query = query.filter(SystemInventory.ram_gb >= min_ram)
+    for arg, column in (('os', SystemInventory.os_name), ('manufacturer', SystemInventory.manufacturer),
+                        ('model', SystemInventory.model)):
+        if request.args.get(arg):
+            query = query.filter(column.ilike(f"%{request.args[arg]}%"))
+    results = [{'system_id': inv.system_id, 'system_name': name, 'computer_name': computer_name,
+                'os_name': inv.os_name, 'manufacturer': inv.manufacturer, 'model': inv.model,
+                'ram_gb': inv.ram_gb, 'collected_at': inv.collected_at.strftime('%Y-%m-%d %H:%M:%S'),
+                'confirmed_at': inv.confirmed_at.strftime('%Y-%m-%d %H:%M:%S')}
+               for inv, name, computer_name in query.order_by(System.name).all()]
+    return jsonify({'count': len(results), 'systems': results})
+
 @bp.route('/api/job/<int:job_id>/status')
 @login_required
 @roles_required('admin')
 def get_job_status(job_id):
     job = Job.query.get_or_404(job_id)
-    return jsonify({'status': job.status, 'output': job.output, 'completed_at': job.completed_at.strftime('%Y-%m-%d %H:%M:%S') if job.completed_at else None})
+    # 带 offset 参数时只返回该位置 (字符数) 之后新增的输出，前端据此增量追加
+    offset = request.args.get('offset', 0, type=int)
+    return jsonify({'status': job.status, 'output': job.read_output(offset), 'output_offset': job.output_size,
+                    'completed_at': job.completed_at.strftime('%Y-%m-%d %H:%M:%S') if job.completed_at else None})
+
+def sse_message(event, data, event_id=None):
+    """格式化一条 Server-Sent Events 消息"""
+    message = f"event: {event}\n"
+    if event_id is not None:
+        message += f"id: {event_id}\n"
+    return message + f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+def sse_response(generator):
+    return Response(stream_with_context(generator), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@bp.route('/api/job/<int:job_id>/events')
+@login_required
+@roles_required('admin')
+def job_events(job_id):
+    """
+    以 SSE 推送任务的状态变化和新增输出，代替前端轮询 /api/job/<id>/status。
+    本进程内的领取/追加输出/上报结果会立即唤醒推送；其他 worker 进程的更新
+    在 JOB_EVENTS_RECHECK_SECONDS 内通过一次主键查询发现。事件 id 为输出长度，
+    浏览器断线重连时通过 Last-Event-ID 从该位置继续。
+    """
+    Job.query.get_or_404(job_id)
+    offset = request.headers.get('Last-Event-ID', type=int)
+    if offset is None:
+        offset = request.args.get('offset', 0, type=int)
+    recheck = current_app.config['JOB_EVENTS_RECHECK_SECONDS']
+    max_seconds = current_app.config['JOB_EVENTS_MAX_SECONDS']
+    key = ('job', job_id)
+
+    def generate():
+        position, last_status = offset, None
+        deadline = time.monotonic() + max_seconds
+        with job_hub.watch(key):
+            while True:
+                version = job_hub.version(key)
+                job = db.session.get(Job, job_id)
+                if job is None:
+                    # 待处理的任务被取消 (删除)
+                    yield sse_message('end', {'status': 'cancelled'})
+                    return
+                status, size = job.status, job.output_size or 0
+                if status != last_status or size > position:
+                    payload = {'status': status, 'output': job.read_output(position), 'output_offset': size,
+                               'completed_at': job.completed_at.strftime('%Y-%m-%d %H:%M:%S') if job.completed_at else None}
+                    position, last_status = size, status
+                    yield sse_message('update', payload, event_id=size)
+                # 等待期间不占用数据库连接
+                db.session.close()
+                if status in ('completed', 'failed'):
+                    yield sse_message('end', {'status': status})
+                    return
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return
+                if not job_hub.wait(key, version, min(recheck, remaining)):
+                    yield ': keepalive\n\n'
+
+    return sse_response(generate())
+
+@bp.route('/api/broadcast/<int:broadcast_id>/events')
+@login_required
+@roles_required('admin')
+def broadcast_events(broadcast_id):
+    """以 SSE 推送批量执行的进度汇总；突发的大量更新合并为每秒最多一次 GROUP BY"""
+    Broadcast.query.get_or_404(broadcast_id)
+    recheck = current_app.config['JOB_EVENTS_RECHECK_SECONDS']
+    max_seconds = current_app.config['JOB_EVENTS_MAX_SECONDS']
+    key = ('broadcast', broadcast_id)
+
+    def generate():
+        last_counts = None
+        deadline = time.monotonic() + max_seconds
+        with job_hub.watch(key):
+            while True:
+                version = job_hub.version(key)
+                broadcast = db.session.get(Broadcast, broadcast_id)
+                counts = broadcast.status_counts()
+                target_count = broadcast.target_count
+                db.session.close()
+                finished = counts['completed'] + counts['failed'] >= sum(counts.values())
+                if counts != last_counts:
+                    last_counts = counts
+                    yield sse_message('update', {'broadcast_id': broadcast_id, 'target_count': target_count,
+                                                 'counts': counts, 'finished': finished})
+                if finished:
+                    yield sse_message('end', {'finished': True})
+                    return
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return
+                if job_hub.wait(key, version, min(recheck, remaining)):
+                    time.sleep(1)
+                else:
+                    yield ': keepalive\n\n'
+
+    return sse_response(generate())
+
+def get_agent_json():
+    """解析 Agent 请求体，支持 Content-Encoding: gzip；解压后超过上限或格式错误时返回 400"""
+    body = request.get_data(cache=False)
+    limit = current_app.config.get('AGENT_MAX_REQUEST_BYTES', 16 * 1024 * 1024)
+    if request.headers.get('Content-Encoding', '').lower() == 'gzip':
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        try:
+            body = decompressor.decompress(body, limit + 1)
+        except zlib.error:
+            abort(400, description='Invalid gzip body')
+        if len(body) > limit or decompressor.unconsumed_tail:
+            abort(413)
+    try:
+        data = json.loads(body or b'null')
+    except ValueError:
+        abort(400, description='Invalid JSON body')
+    if not isinstance(data, dict):
+        abort(400, description='JSON object required')
+    return data
+
+@bp.after_request
+def compress_agent_response(response):
+    """Agent 接口的较大响应 (脚本内容、任务列表) 在客户端接受 gzip 时压缩返回"""
+    if (not request.path.startswith('/api/agent/') or response.direct_passthrough
+            or response.status_code < 200 or response.status_code >= 300
+            or 'Content-Encoding' in response.headers
+            or 'gzip' not in request.headers.get('Accept-Encoding', '').lower()):
+        return response
+    body = response.get_data()
+    if len(body) < current_app.config.get('AGENT_GZIP_MIN_BYTES', 1024):
+        return response
+    response.set_data(gzip.compress(body, compresslevel=6))
+    response.headers['Content-Encoding'] = 'gzip'
+    response.vary.add('Accept-Encoding')
+    return response
+
+def claim_pending_jobs(system_id, limit=1):
+    """
+    原子地领取该系统最早的若干个待处理任务。
+    MySQL 下用 SELECT ... FOR UPDATE SKIP LOCKED 锁定候选行，再用带 status 条件的
+    UPDATE 逐个确认，多个 worker 同时处理重复心跳时同一任务只会被领取一次。
+    """
+    now = datetime.utcnow()
+    candidate_ids = [job_id for (job_id,) in Job.query.with_entities(Job.id)
+                     .filter_by(system_id=system_id, status='pending')
+                     .filter(or_(Job.not_before.is_(None), Job.not_before <= now))
+                     .order_by(Job.created_at, Job.id)
+                     .limit(limit)
+                     .with_for_update(skip_locked=True).all()]
+    claimed_ids = []
+    for job_id in candidate_ids:
+        updated = Job.query.filter_by(id=job_id, status='pending').update(
+            {'status': 'running', 'started_at': now, 'attempts': Job.attempts + 1}, synchronize_session=False)
+        if updated:
+            claimed_ids.append(job_id)
+    db.session.commit()
+    if not claimed_ids:
+        return []
+    jobs = (Job.query.options(joinedload(Job.script)).filter(Job.id.in_(claimed_ids))
+            .order_by(Job.created_at, Job.id).all())
+    for job in jobs:
+        notify_job_update(job.id, job.broadcast_id)
+    return jobs
 
 @bp.route('/api/agent/heartbeat', methods=['POST'])
 def agent_heartbeat():
-    data = request.json
+    data = get_agent_json()
     hostname = data.get('hostname')
     if not hostname:
         return jsonify({'error': 'Hostname is required'}), 400
-    system = System.query.filter(System.computer_name.ilike(hostname)).first()
-    if not system:
+    system_id = hostname_index.lookup(hostname)
+    system_row = (db.session.query(System.accounts_digest, System.last_admin_activity_at)
+                  .filter(System.id == system_id).first() if system_id else None)
+    if system_row is None:
+        if system_id:
+            # 索引是进程内的，其他 worker 删除/改名的系统最迟 ttl 秒后才失效，此处立即重载
+            hostname_index.invalidate()
         return jsonify({'job_id': None, 'message': 'Host not registered'})
-    pending_job = Job.query.filter_by(system_id=system.id, status='pending').order_by(Job.created_at).first()
-    if pending_job:
-        pending_job.status = 'running'
-        pending_job.started_at = datetime.utcnow()
-        db.session.commit()
-        return jsonify({'job_id': pending_job.id, 'script_content': pending_job.script.content})
-    return jsonify({'job_id': None})
+    stored_digest, last_admin_activity_at = system_row
+    # 心跳时间先进入进程内缓冲，由后台线程批量写回 System.last_seen_at
+    last_seen_buffer.touch(system_id)
+    last_seen_buffer.ensure_started(current_app._get_current_object())
+    heartbeat_rate.hit()
+    long_poll = bool(data.get('wait'))
+    # 本地账户摘要与服务器记录不一致时要求 Agent 上传完整列表，此时不挂起心跳
+    send_accounts = bool(data.get('accounts_digest')) and stored_digest != data['accounts_digest']
+    long_poll = long_poll and not send_accounts
+
+    def respond(payload, claimed=False):
+        if send_accounts:
+            payload['send_accounts'] = True
+        # 下一次心跳的间隔建议；要上传账户列表或本次是长轮询时立即再次心跳
+        payload['next_poll_seconds'] = next_poll_seconds(
+            system_id, current_app.config, last_admin_activity_at, claimed=claimed or send_accounts,
+            long_poll=payload.get('long_poll', False))
+        return jsonify(payload)
+
+    try:
+        max_jobs = int(data.get('max_jobs', 1))
+    except (TypeError, ValueError):
+        max_jobs = 1
+    max_jobs = max(0, min(max_jobs, current_app.config['AGENT_MAX_JOBS_PER_HEARTBEAT']))
+    if max_jobs == 0:
+        # Agent 的执行槽位已满，只作为存活心跳，不领取任务也不挂起
+        return respond({'job_id': None, 'jobs': [], 'long_poll': False})
+    signal_key = ('system', system_id)
+    signal_version = job_hub.version(signal_key)
+
+    claimed_jobs = claim_pending_jobs(system_id, max_jobs)
+    if not claimed_jobs and long_poll:
+        # 长轮询：释放数据库连接后挂起，直到有新任务入队的通知或超时
+        new_job_watcher.ensure_started(current_app._get_current_object())
+        db.session.close()
+        deadline = time.monotonic() + current_app.config['AGENT_LONG_POLL_TIMEOUT']
+        while not claimed_jobs:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not job_hub.wait(signal_key, signal_version, remaining):
+                break
+            signal_version = job_hub.version(signal_key)
+            claimed_jobs = claim_pending_jobs(system_id, max_jobs)
+
+    if claimed_jobs:
+        # 支持脚本缓存的 Agent 只拿到内容哈希，缓存未命中时再通过 /api/agent/script/<hash> 取正文
+        script_cache = bool(data.get('script_cache'))
+        jobs = []
+        for job in claimed_jobs:
+            job_data = {'job_id': job.id, 'script_id': job.script_id, 'script_hash': job.script.content_hash}
+            if not script_cache:
+                job_data['script_content'] = job.script.content
+            jobs.append(job_data)
+        response = {'job_id': jobs[0]['job_id'], 'jobs': jobs, 'long_poll': long_poll}
+        if not script_cache:
+            # 顶层的 job_id / script_content 保留给只认识单个任务的旧版 Agent
+            response['script_content'] = jobs[0]['script_content']
+        return respond(response, claimed=True)
+    return respond({'job_id': None, 'jobs': [], 'long_poll': long_poll})
 
 @bp.route('/api/agent/report_job_result', methods=['POST'])
 def agent_report_job_result():
-    data = request.json
-    job_id, status, output = data.get('job_id'), data.get('status'), data.get('output')
+    data = get_agent_json()
+    job_id, status = data.get('job_id'), data.get('status')
     if not job_id:
         return jsonify({'error': 'Job ID is required'}), 400
     job = Job.query.get(job_id)
     if job:
-        job.status, job.output, job.completed_at = status, output, datetime.utcnow()
+        # 新版 Agent 会附带主机名，拒绝其他主机冒报结果
+        hostname = data.get('hostname')
+        if hostname and hostname_index.lookup(hostname) != job.system_id:
+            return jsonify({'error': 'Job does not belong to this host'}), 403
+        apply_job_result(job, status, data)
         db.session.commit()
+        notify_job_update(job.id, job.broadcast_id)
         return jsonify({'status': 'success'})
     return jsonify({'error': 'Job not found'}), 404
+
+def apply_job_result(job, status, data):
+    """写入任务的最终状态和输出 (不提交)；清单类脚本的输出同时解析为结构化信息"""
+    # 以流式上报输出的 Agent 不再携带 output，保留已追加的内容并合并为单个压缩块
+    if 'output' in data:
+        output = data.get('output')
+        job.replace_output(output)
+    else:
+        job.compact_output()
+        output = None
+    job.status, job.completed_at = status, datetime.utcnow()
+    if status == 'completed' and job.script and job.script.name.lower() in INVENTORY_PARSERS:
+        record_inventory(job, output if output is not None else job.read_output())
+
+@bp.route('/api/agent/report_job_results', methods=['POST'])
+def agent_report_job_results():
+    """批量上报任务结果，所有结果在同一个事务中提交。
+
+    返回每个 job_id 的处理结论；Agent 据此从本地结果日志中删除已送达的条目，
+    因此重复上报 (上次提交成功但响应丢失) 必须是幂等的。
+    格式错误的条目 (不是对象或 job_id 不是整数) 不进入 results，只在 rejected 中列出其下标，
+    Agent 会直接丢弃这些条目，不再重试。
+    """
+    data = get_agent_json()
+    results = data.get('results')
+    if not isinstance(results, list) or not results:
+        return jsonify({'error': 'results is required'}), 400
+    if len(results) > current_app.config.get('AGENT_MAX_RESULTS_PER_REPORT', 200):
+        return jsonify({'error': 'Too many results'}), 413
+    system_id = hostname_index.lookup(data.get('hostname'))
+    if not system_id:
+        return jsonify({'error': 'Host not registered'}), 403
+
+    by_id, rejected, outcomes = {}, [], {}
+    for index, item in enumerate(results):
+        job_id = item.get('job_id') if isinstance(item, dict) else None
+        if isinstance(job_id, int) and not isinstance(job_id, bool):
+            by_id[job_id] = item
+        else:
+            # 只记下标，不放进 results (其 job_id 可能不是整数，与其他键混在一起 jsonify 无法排序)
+            rejected.append(index)
+    jobs = ({job.id: job for job in Job.query.options(joinedload(Job.script)).filter(Job.id.in_(by_id.keys())).all()}
+            if by_id else {})
+
+    for job_id, item in by_id.items():
+        job = jobs.get(job_id)
+        if job is None:
+            outcomes[job_id] = 'not_found'
+        elif job.system_id != system_id:
+            outcomes[job_id] = 'forbidden'
+        elif item.get('status') not in ('completed', 'failed'):
+            outcomes[job_id] = 'invalid'
+        elif job.status in ('completed', 'failed'):
+            outcomes[job_id] = 'duplicate'
+        else:
+            apply_job_result(job, item['status'], item)
+            outcomes[job_id] = 'ok'
+    db.session.commit()
+    for job_id, outcome in outcomes.items():
+        if outcome == 'ok':
+            notify_job_update(job_id, jobs[job_id].broadcast_id)
+    return jsonify({'status': 'success', 'results': outcomes, 'rejected': rejected})
+
+@bp.route('/api/agent/accounts', methods=['POST'])
+def agent_report_accounts():
+    """接收 Agent 的本地账户完整列表 (仅在心跳返回 send_accounts 时上传)，同步电脑用户"""
+    data = get_agent_json()
+    system_id = hostname_index.lookup(data.get('hostname'))
+    if not system_id:
+        return jsonify({'error': 'Host not registered'}), 403
+    digest, accounts = data.get('digest'), data.get('accounts')
+    if not digest or not isinstance(accounts, list):
+        return jsonify({'error': 'digest and accounts are required'}), 400
+    system = System.query.get(system_id)
+    if system is None:
+        hostname_index.invalidate()
+        return jsonify({'error': 'Host not registered'}), 403
+    changes = reconcile_system_accounts(system, accounts, digest,
+                                        ignored=current_app.config.get('AGENT_IGNORED_LOCAL_ACCOUNTS', ()))
+    db.session.commit()
+    return jsonify({'status': 'success', 'changes': changes})
+
+@bp.route('/api/agent/script/<string:content_hash>')
+def agent_get_script(content_hash):
+    """按内容哈希获取脚本正文 (包括已被修改前的历史版本)"""
+    content = ScriptVersion.find_content(content_hash)
+    if content is None:
+        return jsonify({'error': 'Script not found'}), 404
+    return jsonify({'script_hash': content_hash, 'script_content': content})
+
+@bp.route('/api/agent/append_job_output', methods=['POST'])
+def agent_append_job_output():
+    """
+    Agent 在脚本运行期间分块追加输出。
+    offset 为该块在完整输出中的起始位置 (字符数)：重复发送的部分会被跳过，
+    出现空洞时返回 409 和服务器当前的长度，由 Agent 从该位置重发。
+    """
+    data = get_agent_json()
+    job_id, chunk = data.get('job_id'), data.get('data') or ''
+    try:
+        offset = int(data.get('offset', 0))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Invalid offset'}), 400
+    if not job_id:
+        return jsonify({'error': 'Job ID is required'}), 400
+    job = Job.query.get(job_id)
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+    hostname = data.get('hostname')
+    if hostname and hostname_index.lookup(hostname) != job.system_id:
+        return jsonify({'error': 'Job does not belong to this host'}), 403
+    if job.status != 'running':
+        return jsonify({'error': 'Job is not running', 'status': job.status}), 409
+
+    current_size = job.output_size
+    if offset > current_size:
+        return jsonify({'error': 'Offset gap', 'offset': current_size}), 409
+    new_part = chunk[current_size - offset:]
+    if new_part:
+        job.append_output(new_part)
+        db.session.commit()
+        notify_job_update(job.id)
+    return jsonify({'status': 'success', 'offset': job.output_size})
 @bp.route('/admin/requests/menjin_privilege_delete/<int:request_id>/approve', methods=['POST'])
 @login_required
 @roles_required('admin')
@@ -1547,7 +2124,7 @@ def cancel_menjin_privilege_del_request(request_id):
 
 @bp.route('/api/agent/register_pending_system', methods=['POST'])
 def agent_register_pending_system():
-    data = request.json
+    data = get_agent_json()
     system_name = data.get('system_name')
     hostname = data.get('hostname')
     ip_addresses = data.get('ip_addresses')
@@ -1555,38 +2132,61 @@ def agent_register_pending_system():
     if not system_name or not hostname:
         return jsonify({'status': 'error', 'message': '缺少必要信息。'}), 400
 
-    existing = PendingSystem.query.filter_by(computer_name=hostname).first()
-    if existing:
-        existing.system_name = system_name
-        existing.ip_address = ip_addresses
-        existing.first_seen = datetime.utcnow()
-        message = "信息已更新。"
-    else:
-        new_pending_system = PendingSystem(
-            system_name=system_name,
-            computer_name=hostname,
-            ip_address=ip_addresses
-        )
-        db.session.add(new_pending_system)
-        message = "新计算机信息已成功记录。"
-    
+    if not normalize_hostname(hostname):
+        return jsonify({'status': 'error', 'message': '计算机名无效。'}), 400
+
     try:
+        # 单条 upsert 语句，同一主机重复注册或并发注册都只保留一条记录
+        system_id, matched_id = register_pending_system(system_name, hostname, ip_addresses)
         db.session.commit()
-        return jsonify({'status': 'success', 'message': message})
     except Exception as e:
         db.session.rollback()
         return jsonify({'status': 'error', 'message': f'数据库错误: {e}'}), 500
 
+    if system_id is not None:
+        return jsonify({'status': 'success', 'message': '该计算机已登记为系统，无需添加。', 'system_id': system_id})
+    if matched_id is not None:
+        return jsonify({'status': 'success', 'message': '计算机信息已记录 (IP 与已有系统相同，等待管理员确认)。',
+                        'matched_system_id': matched_id})
+    return jsonify({'status': 'success', 'message': '计算机信息已记录。'})
+
 
 # 2. Page - 用于管理员查看列表
 @bp.route('/admin/pending_systems')
 @login_required
 @roles_required('admin')
 def pending_systems():
-    pending_list = PendingSystem.query.order_by(PendingSystem.first_seen.desc()).all()
+    pending_list = (PendingSystem.query.options(joinedload(PendingSystem.matched_system))
+                    .order_by(PendingSystem.first_seen.desc()).all())
+    groups = Group.query.order_by(Group.name).all()
     return render_template('admin_pending_systems.html', 
                            title='待添加系统',
-                           pending_list=pending_list)
+                           pending_list=pending_list,
+                           groups=groups)
+
+# 批量转为正式系统
+@bp.route('/admin/pending_systems/promote', methods=['POST'])
+@login_required
+@roles_required('admin')
+def promote_pending_systems_route():
+    pending_ids = request.form.getlist('pending_ids', type=int)
+    if not pending_ids:
+        flash('请先勾选要添加的计算机。', 'warning')
+        return redirect(url_for('routes.pending_systems'))
+    group_id = request.form.get('group_id', type=int) or None
+    if group_id and db.session.get(Group, group_id) is None:
+        flash('所选分组不存在。', 'danger')
+        return redirect(url_for('routes.pending_systems'))
+    try:
+        result = promote_pending_systems(pending_ids, group_id=group_id)
+    except Exception as e:
+        flash(f'批量添加失败，所有更改已回滚: {e}', 'danger')
+        return redirect(url_for('routes.pending_systems'))
+    flash(f'已新建 {result["created"]} 个系统，更新 {result["updated"]} 个已有系统的计算机名。'
+          f'新系统的系统编号暂为计算机名，请及时修改。', 'success')
+    if result['skipped']:
+        flash(f'以下计算机的系统编号与已有系统冲突，未添加: {", ".join(result["skipped"])}', 'warning')
+    return redirect(url_for('routes.pending_systems'))
 
 # 3. Action - 用于管理员从列表中删除已处理的条目
 @bp.route('/admin/pending_systems/<int:pending_id>/delete', methods=['POST'])
@@ -0,0 +1,265 @@
+# app/scheduler.py
+"""
+定时执行计划的调度器。
+
+JobSchedule 保存 cron 表达式和目标 (分组或系统列表)。调度循环每隔
+SCHEDULER_INTERVAL 秒检查一次到期的计划，为每个计划生成一个 Broadcast，
+并用 Job.bulk_create 批量写入任务；任务的 not_before 在 jitter 窗口内
+随机分布，Agent 会在各自的时间点领取，避免整点同时压向数据库。
+
+多个 web worker 都可以启动调度线程，但只有持有 scheduler_lease 租约的
+那一个会真正生成任务；租约过期 (持有者退出) 后由其他 worker 接管。
+租约持有者同时负责回收卡死的任务，并按 JOB_RETENTION_DAYS 分批归档历史任务。
+"""
+import os
+import socket
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy import or_
+from sqlalchemy.exc import IntegrityError
+
+
+# --- cron 表达式 ---
+class CronExpression:
+    """最小化的 5 段 cron 解析 (分 时 日 月 周)，支持 *、*/n、a-b、a-b/n 和逗号列表。
+
+    周字段 0 和 7 都表示周日；日和周同时受限时按 cron 惯例取“或”。
+    """
+
+    FIELDS = (('minute', 0, 59), ('hour', 0, 23), ('day', 1, 31), ('month', 1, 12), ('weekday', 0, 7))
+
+    def __init__(self, expr):
+        parts = (expr or '').split()
+        if len(parts) != 5:
+            raise ValueError('cron 表达式必须包含 5 段: 分 时 日 月 周')
+        self.expr = ' '.join(parts)
+        values = [self._parse_field(part, low, high) for part, (_, low, high) in zip(parts, self.FIELDS)]
+        self.minutes, self.hours, self.days, self.months, weekdays = values
+        self.weekdays = {0 if d == 7 else d for d in weekdays}
+        self.day_restricted = parts[2] != '*'
+        self.weekday_restricted = parts[4] != '*'
+
+    @staticmethod
+    def _parse_field(field, low, high):
+        values = set()
+        for item in field.split(','):
+            step = 1
+            if '/' in item:
+                item, step_text = item.split('/', 1)
+                if not step_text.isdigit() or int(step_text) == 0:
+                    raise ValueError(f'无效的步长: {field}')
+                step = int(step_text)
+            if item == '*':
+                start, end = low, high
+            elif '-' in item:
+                start_text, end_text = item.split('-', 1)
+                if not (start_text.isdigit() and end_text.isdigit()):
+                    raise ValueError(f'无效的范围: {field}')
+                start, end = int(start_text), int(end_text)
+            elif item.isdigit():
+                start = end = int(item)
+                if step != 1:
+                    end = high
+            else:
+                raise ValueError(f'无效的字段: {field}')
+            if start < low or end > high or start > end:
+                raise ValueError(f'超出范围 ({low}-{high}): {field}')
+            values.update(range(start, end + 1, step))
+        return values
+
+    def _day_matches(self, dt):
+        # Python 的 weekday() 周一为 0，cron 周日为 0
+        day_ok = dt.day in self.days
+        weekday_ok = (dt.weekday() + 1) % 7 in self.weekdays
+        if self.day_restricted and self.weekday_restricted:
+            return day_ok or weekday_ok
+        return day_ok and weekday_ok
+
+    def next_after(self, dt):
+        """返回严格晚于 dt 的下一个触发时间 (精确到分钟)"""
+        dt = dt.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = dt + timedelta(days=366 * 5)
+        while dt < limit:
+            if dt.month not in self.months:
+                dt = (dt.replace(day=1, hour=0, minute=0) + timedelta(days=32)).replace(day=1)
+                continue
+            if not self._day_matches(dt):
+                dt = dt.replace(hour=0, minute=0) + timedelta(days=1)
+                continue
+            if dt.hour not in self.hours:
+                dt = dt.replace(minute=0) + timedelta(hours=1)
+                continue
+            if dt.minute not in self.minutes:
+                dt += timedelta(minutes=1)
+                continue
+            return dt
+        raise ValueError(f'cron 表达式永远不会触发: {self.expr}')
+
+
+# --- 主节点租约 ---
+LEASE_NAME = 'job_scheduler'
+
+
+def acquire_lease(holder, ttl):
+    """获取或续期调度租约，成功返回 True。一条带条件的 UPDATE 保证同一时刻只有一个持有者。"""
+    from app import db
+    from app.models import SchedulerLease
+
+    now = datetime.utcnow()
+    expires_at = now + timedelta(seconds=ttl)
+    updated = (SchedulerLease.query
+               .filter(SchedulerLease.name == LEASE_NAME,
+                       or_(SchedulerLease.holder == holder, SchedulerLease.expires_at < now))
+               .update({'holder': holder, 'expires_at': expires_at}, synchronize_session=False))
+    if updated:
+        db.session.commit()
+        return True
+    if db.session.get(SchedulerLease, LEASE_NAME) is not None:
+        db.session.rollback()
+        return False
+    try:
+        db.session.add(SchedulerLease(name=LEASE_NAME, holder=holder, expires_at=expires_at))
+        db.session.commit()
+        return True
+    except IntegrityError:
+        # 另一个 worker 同时插入了租约行
+        db.session.rollback()
+        return False
+
+
+# --- 生成任务 ---
+def schedule_targets(schedule):
+    """计划的目标系统 id (只包含填写了计算机名、可运行 Agent 的系统)"""
+    from app import db
+    from app.models import System
+
+    query = db.session.query(System.id).filter(System.computer_name.isnot(None), System.computer_name != '')
+    if schedule.group_id:
+        query = query.filter(System.group_id == schedule.group_id)
+    else:
+        ids = schedule.system_id_list
+        if not ids:
+            return []
+        query = query.filter(System.id.in_(ids))
+    return [row.id for row in query.all()]
+
+
+def materialize_schedule(schedule, run_at):
+    """为一次到期的计划创建 Broadcast 和全部任务 (不提交)，返回目标系统 id 列表"""
+    from app import db
+    from app.models import Broadcast, Job
+
+    target_ids = schedule_targets(schedule)
+    if not target_ids:
+        return []
+    broadcast = Broadcast(script_id=schedule.script_id, requested_by_id=schedule.created_by_id,
+                          group_id=schedule.group_id, schedule_id=schedule.id,
+                          target_count=len(target_ids))
+    db.session.add(broadcast)
+    db.session.flush()
+    Job.bulk_create(target_ids, schedule.script_id, schedule.created_by_id, broadcast_id=broadcast.id,
+                    run_at=run_at, jitter_seconds=schedule.jitter_seconds or 0)
+    return target_ids
+
+
+def run_due_schedules(now=None):
+    """生成所有到期计划的任务。错过的多次触发 (调度器停机期间) 只补一次。
+
+    返回 [(schedule_id, 任务数), ...]。调用方需要先持有租约。
+    """
+    from app import db
+    from app.models import JobSchedule
+    from app.job_signals import notify_system_jobs
+
+    now = now or datetime.utcnow()
+    due = (JobSchedule.query
+           .filter(JobSchedule.is_enabled.is_(True), JobSchedule.next_run_at <= now)
+           .order_by(JobSchedule.next_run_at).all())
+    results = []
+    for schedule in due:
+        try:
+            run_at = schedule.next_run_at
+            # 错过的触发时间以当前时间为错峰窗口起点
+            target_ids = materialize_schedule(schedule, max(run_at, now))
+            schedule.last_run_at = now
+            schedule.next_run_at = CronExpression(schedule.cron).next_after(now)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            print(f"[scheduler] 计划 {schedule.id} 生成任务失败: {e}")
+            continue
+        results.append((schedule.id, len(target_ids)))
+        # 有错峰窗口的任务稍后才可领取，不必立即唤醒心跳
+        if not schedule.jitter_seconds:
+            for system_id in target_ids:
+                notify_system_jobs(system_id)
+    return results
+
+
+class Scheduler:
+    """后台调度线程；每个进程一个，只有持有租约的进程会生成任务。"""
+
+    def __init__(self):
+        self.holder = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def tick(self, app):
+        """执行一次：续租成功则生成到期任务、回收卡死任务并归档一部分历史任务"""
+        with app.app_context():
+            ttl = app.config.get('SCHEDULER_LEASE_SECONDS', 60)
+            if not acquire_lease(self.holder, ttl):
+                return None
+            results = run_due_schedules()
+            self._reap_stuck_jobs(app)
+            self._archive_old_jobs(app)
+            return results
+
+    def _reap_stuck_jobs(self, app):
+        from app.agent_presence import reap_stuck_jobs
+
+        try:
+            requeued, failed = reap_stuck_jobs(app.config.get('JOB_RUNNING_TIMEOUT_SECONDS', 900),
+                                               app.config.get('JOB_MAX_ATTEMPTS', 2))
+            if requeued or failed:
+                print(f"[scheduler] 回收超时任务: 重新排队 {requeued} 个, 标记失败 {failed} 个")
+        except Exception as e:
+            print(f"[scheduler] 回收超时任务失败: {e}")
+
+    def _archive_old_jobs(self, app):
+        from app.retention import archive_old_jobs
+
+        days = app.config.get('JOB_RETENTION_DAYS')
+        if not days:
+            return
+        try:
+            archived = archive_old_jobs(days, batch_size=app.config.get('JOB_ARCHIVE_BATCH_SIZE', 500),
+                                        max_batches=app.config.get('JOB_ARCHIVE_MAX_BATCHES_PER_RUN', 20))
+            if archived:
+                print(f"[scheduler] 已归档 {archived} 个历史任务")
+        except Exception as e:
+            print(f"[scheduler] 归档历史任务失败: {e}")
+
+    def run_forever(self, app):
+        interval = app.config.get('SCHEDULER_INTERVAL', 15)
+        while True:
+            try:
+                self.tick(app)
+            except Exception as e:
+                print(f"[scheduler] 调度失败: {e}")
+            time.sleep(interval)
+
+    def ensure_started(self, app):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self.run_forever, args=(app,), name='job-scheduler', daemon=True)
+            self._thread.start()
+
+
+scheduler = Scheduler()
@@ -0,0 +1,115 @@
+# app/system_onboarding.py
+"""
+Agent 上报的待添加系统：自动匹配与批量转为正式系统。
+
+注册时先按规范化的计算机名匹配已有系统 (已登记则不再进入待添加列表)，
+再按 IP 匹配 (计算机名不同但 IP 相同，多为改名或重装)，匹配结果记录在
+PendingSystem.matched_system_id 上供管理员确认。
+
+promote_pending_systems 在一个事务内处理管理员勾选的条目：
+未匹配的创建 System，按 IP 匹配到的更新该系统的计算机名和 IP。
+"""
+from datetime import datetime
+
+
+def match_system_by_ip(ip_addresses):
+    """上报的 IP 中恰好对应一个已有系统时返回其 id，否则返回 None"""
+    from app import db
+    from app.models import PendingSystem, System
+
+    ips = PendingSystem.split_ips(ip_addresses)
+    if not ips:
+        return None
+    # 由 system.ip_address 索引支撑
+    matches = {row.id for row in db.session.query(System.id).filter(System.ip_address.in_(ips)).all()}
+    return matches.pop() if len(matches) == 1 else None
+
+
+def register_pending_system(system_name, hostname, ip_addresses):
+    """记录一次 Agent 注册 (不提交)。
+
+    返回 (已登记的 system_id 或 None, 按 IP 匹配到的 system_id 或 None)。
+    """
+    from app.models import PendingSystem
+    from app.hostname_index import hostname_index, normalize_hostname
+
+    key = normalize_hostname(hostname)
+    system_id = hostname_index.lookup(key)
+    if system_id is not None:
+        # 已是正式系统：清理此前遗留的待添加记录
+        PendingSystem.query.filter_by(hostname_key=key).delete(synchronize_session=False)
+        return system_id, None
+
+    matched_id = match_system_by_ip(ip_addresses)
+    PendingSystem.upsert({
+        'system_name': system_name[:150],
+        'computer_name': hostname.strip()[:100],
+        'hostname_key': key,
+        'ip_address': (ip_addresses or '')[:255] or None,
+        'first_seen': datetime.utcnow(),
+        'status': 'pending',
+        'matched_system_id': matched_id,
+        'match_reason': 'ip' if matched_id else None,
+    })
+    return None, matched_id
+
+
+def promote_pending_systems(pending_ids, group_id=None, check_frequency_days=90):
+    """把勾选的待添加条目转为正式系统 (单个事务，失败时整体回滚)。
+
+    新系统的系统编号暂用计算机名 (大写) 占位；与已有编号冲突的条目跳过。
+    返回 {'created': n, 'updated': n, 'skipped': [计算机名, ...]}。
+    """
+    from app import db
+    from app.models import PendingSystem, System
+    from app.hostname_index import hostname_index
+
+    pending_list = (PendingSystem.query.filter(PendingSystem.id.in_(pending_ids))
+                    .order_by(PendingSystem.computer_name).all())
+    if not pending_list:
+        return {'created': 0, 'updated': 0, 'skipped': []}
+
+    keys = [pending.hostname_key for pending in pending_list if pending.hostname_key]
+    # 一次查询取回本批相关的已有主机名和系统编号
+    registered = {key for (key,) in db.session.query(System.hostname_key).filter(System.hostname_key.in_(keys))}
+    numbers = [pending.computer_name.upper()[:50] for pending in pending_list]
+    taken_numbers = {number.upper() for (number,) in
+                     db.session.query(System.system_number).filter(System.system_number.in_(numbers))}
+    matched = {system.id: system for system in System.query.filter(
+        System.id.in_([p.matched_system_id for p in pending_list if p.matched_system_id])).all()}
+
+    created, updated, skipped, done = 0, 0, [], []
+    try:
+        for pending in pending_list:
+            ips = PendingSystem.split_ips(pending.ip_address)
+            ip_address = ips[0][:45] if ips else None
+            if pending.hostname_key in registered:
+                # 注册之后已有人手动添加了该系统
+                done.append(pending)
+                continue
+            system = matched.get(pending.matched_system_id)
+            if system is not None:
+                system.computer_name = pending.computer_name
+                if ip_address and system.ip_address not in ips:
+                    system.ip_address = ip_address
+                updated += 1
+            else:
+                number = pending.computer_name.upper()[:50]
+                if number in taken_numbers:
+                    skipped.append(pending.computer_name)
+                    continue
+                taken_numbers.add(number)
+                db.session.add(System(name=pending.system_name, system_number=number, group_id=group_id,
+                                      check_frequency_days=check_frequency_days,
+                                      computer_name=pending.computer_name, ip_address=ip_address))
+                created += 1
+            registered.add(pending.hostname_key)
+            done.append(pending)
+        for pending in done:
+            db.session.delete(pending)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    hostname_index.invalidate()
+    return {'created': created, 'updated': updated, 'skipped': skipped}
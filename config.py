@@ -12,4 +12,66 @@ class Config:
 
     # 预定义的工作站角色清单 (用于数据库初始化)
     WORKSTATION_ROLES = ['系统管理员', '部门管理员', '组长', '操作员', '审计员']
-    PERMANENT_SESSION_LIFETIME = timedelta(minutes=10)
\ No newline at end of file
+    PERMANENT_SESSION_LIFETIME = timedelta(minutes=10)
+
+    # --- Agent 长轮询心跳 ---
+    # 心跳请求在没有任务时最多挂起的秒数 (需小于 Agent 端的请求超时)。
+    # 长轮询会占用一个线程，部署时请使用多线程 worker (如 gunicorn --threads)。
+    AGENT_LONG_POLL_TIMEOUT = 25
+    # 每个 worker 进程扫描其他进程新建任务的间隔 (秒)
+    AGENT_LONG_POLL_WATCH_INTERVAL = 1
+    # 任务状态推送 (SSE)：跨进程更新的兜底检查间隔，以及单个连接的最长时间 (之后浏览器自动重连)。
+    # 与长轮询一样，每个推送连接占用一个线程。
+    JOB_EVENTS_RECHECK_SECONDS = 3
+    JOB_EVENTS_MAX_SECONDS = 300
+    # Agent 心跳时间批量写回数据库的间隔 (秒)，以及超过多久没有心跳视为离线
+    # (需大于 AGENT_POLL_MAX_SECONDS，否则放慢心跳的空闲主机会被误判为离线)
+    AGENT_LAST_SEEN_FLUSH_SECONDS = 30
+    AGENT_OFFLINE_AFTER_SECONDS = 420
+    # 心跳响应中的下一次心跳间隔建议 (秒)：管理员最近操作过的主机、空闲主机，以及上下限。
+    # 本进程心跳速率超过 AGENT_POLL_TARGET_HEARTBEATS_PER_SECOND 时按比例放大间隔。
+    # 只作用于不使用长轮询的心跳 (长轮询的 Agent 返回后立即再次长轮询)。
+    AGENT_POLL_ACTIVE_SECONDS = 5
+    AGENT_POLL_IDLE_SECONDS = 120
+    AGENT_POLL_MIN_SECONDS = 5
+    AGENT_POLL_MAX_SECONDS = 300
+    AGENT_POLL_ACTIVE_WINDOW_SECONDS = 900
+    AGENT_POLL_TARGET_HEARTBEATS_PER_SECOND = 50
+    # 同一系统的管理员活动时间最多每隔多少秒写入一次
+    AGENT_ADMIN_ACTIVITY_WRITE_SECONDS = 60
+    # 单次心跳最多领取的任务数
+    AGENT_MAX_JOBS_PER_HEARTBEAT = 10
+    # Agent 同步本地账户时忽略的 Windows 内置账户 (不区分大小写)
+    AGENT_IGNORED_LOCAL_ACCOUNTS = ('Administrator', 'Guest', 'DefaultAccount', 'WDAGUtilityAccount', 'defaultuser0')
+    # 单次批量上报最多包含的任务结果数
+    AGENT_MAX_RESULTS_PER_REPORT = 200
+    # Agent 请求体 (gzip 解压后) 的最大字节数
+    AGENT_MAX_REQUEST_BYTES = 16 * 1024 * 1024
+    # 超过该大小的 Agent 接口响应在客户端支持时使用 gzip 压缩
+    AGENT_GZIP_MIN_BYTES = 1024
+
+    # --- 定时执行计划 ---
+    # 是否在 web 进程内启动调度线程 (也可以单独运行 flask run-scheduler)
+    SCHEDULER_ENABLED = os.environ.get('SCHEDULER_ENABLED', '').lower() in ('1', 'true', 'yes')
+    # 检查到期计划的间隔和主节点租约时长 (秒)，租约需明显长于检查间隔
+    SCHEDULER_INTERVAL = 15
+    SCHEDULER_LEASE_SECONDS = 60
+
+    # --- 任务历史保留 ---
+    # 结束超过该天数的任务迁入 job_archive；设为 0 则不自动归档
+    JOB_RETENTION_DAYS = 180
+    # 每批归档的任务数 (每批一个事务)，以及调度器每次最多处理的批数
+    JOB_ARCHIVE_BATCH_SIZE = 500
+    JOB_ARCHIVE_MAX_BATCHES_PER_RUN = 20
+
+    # --- 卡死任务回收 (由调度器的租约持有者执行) ---
+    # running 状态超过该秒数仍未上报结果的任务会被回收 (Agent 端脚本超时为 300 秒)
+    JOB_RUNNING_TIMEOUT_SECONDS = 900
+    # 任务最多被领取的次数；未达到时回收后重新排队，否则标记为失败
+    JOB_MAX_ATTEMPTS = 2
+    # 用户目录每页的账户数 (游标分页，前端滚动加载)
+    USER_DIRECTORY_PAGE_SIZE = 100
+    # 账户搜索：进程内索引命中超过该数量时改用 SQL 条件过滤 (避免过长的 IN 列表)
+    ACCOUNT_SEARCH_MAX_IDS = 2000
+    # 访问权限导出：服务器端游标每批取回的行数
+    ACCESS_EXPORT_BATCH_SIZE = 1000
\ No newline at end of file
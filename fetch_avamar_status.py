@@ -14,6 +14,7 @@ AVMGR_PATH = 'C:\\Program Files\\avs\\bin\\avmgr.exe'
 # 这部分代码允许我们在独立脚本中使用 Flask 应用的上下文和数据库模型
 from app import create_app, db
 from app.models import System
+from app.hostname_index import normalize_hostname
 
 app = create_app()
 
@@ -60,8 +61,8 @@ def update_database_with_logs(xml_data):
     # 使用 with app.app_context() 来访问数据库
     with app.app_context():
         # 1. 一次性获取所有需要匹配的系统，并存入字典以便快速查找
-        systems_to_check = System.query.filter(System.computer_name != None, System.computer_name != '').all()
-        systems_map = {s.computer_name.lower(): s for s in systems_to_check}
+        systems_to_check = System.query.filter(System.hostname_key != None, System.hostname_key != '').all()
+        systems_map = {s.hostname_key: s for s in systems_to_check}
         
         # 2. 将所有系统的状态先重置为“24小时内无备份”
         for system in systems_to_check:
@@ -73,7 +74,7 @@ def update_database_with_logs(xml_data):
             
             # 遍历日志中的每一行
             for row in root.findall('.//row'):
-                client_name = row.get('client', '').strip().lower()
+                client_name = normalize_hostname(row.get('client', ''))
                 status = row.get('status', 'Unknown')
                 end_time_str = row.get('end', '')
 
@@ -0,0 +1,55 @@
+"""Add job_archive table and job script/completion indexes
+
+Revision ID: 0c4d9e2f7a85
+Revises: f2b7c4e9a160
+Create Date: 2026-10-18 16:02:19.845530
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0c4d9e2f7a85'
+down_revision = 'f2b7c4e9a160'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('job_archive',
+    sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('system_id', sa.Integer(), nullable=False),
+    sa.Column('script_id', sa.Integer(), nullable=False),
+    sa.Column('requested_by_id', sa.Integer(), nullable=False),
+    sa.Column('broadcast_id', sa.Integer(), nullable=True),
+    sa.Column('computer_name', sa.String(length=100), nullable=True),
+    sa.Column('script_name', sa.String(length=100), nullable=True),
+    sa.Column('status', sa.String(length=20), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('started_at', sa.DateTime(), nullable=True),
+    sa.Column('completed_at', sa.DateTime(), nullable=True),
+    sa.Column('output_size', sa.Integer(), nullable=False),
+    sa.Column('output_data', sa.LargeBinary(length=16777215), nullable=True),
+    sa.Column('archived_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('job_archive', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_job_archive_completed_at'), ['completed_at'], unique=False)
+        batch_op.create_index(batch_op.f('ix_job_archive_system_id'), ['system_id'], unique=False)
+
+    with op.batch_alter_table('job', schema=None) as batch_op:
+        batch_op.create_index('ix_job_script_id', ['script_id'], unique=False)
+        batch_op.create_index('ix_job_status_completed', ['status', 'completed_at'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('job', schema=None) as batch_op:
+        batch_op.drop_index('ix_job_status_completed')
+        batch_op.drop_index('ix_job_script_id')
+
+    with op.batch_alter_table('job_archive', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_job_archive_system_id'))
+        batch_op.drop_index(batch_op.f('ix_job_archive_completed_at'))
+
+    op.drop_table('job_archive')
@@ -0,0 +1,37 @@
+"""Add hostname_key to system
+
+Revision ID: 3f9a1c2e7b64
+Revises: d7824f3c16bf
+Create Date: 2026-10-18 09:12:40.118230
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f9a1c2e7b64'
+down_revision = 'd7824f3c16bf'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('system', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('hostname_key', sa.String(length=100), nullable=True))
+        batch_op.create_index(batch_op.f('ix_system_hostname_key'), ['hostname_key'], unique=False)
+
+    # 回填已有数据，规则与 app.hostname_index.normalize_hostname 保持一致
+    system = sa.table('system', sa.column('id', sa.Integer), sa.column('computer_name', sa.String),
+                      sa.column('hostname_key', sa.String))
+    conn = op.get_bind()
+    rows = conn.execute(sa.select(system.c.id, system.c.computer_name)
+                        .where(system.c.computer_name.isnot(None))).fetchall()
+    for system_id, computer_name in rows:
+        key = computer_name.strip().rstrip('.').lower() or None
+        conn.execute(system.update().where(system.c.id == system_id).values(hostname_key=key))
+
+def downgrade():
+    with op.batch_alter_table('system', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_system_hostname_key'))
+        batch_op.drop_column('hostname_key')
@@ -0,0 +1,44 @@
+"""Add system_inventory table
+
+Revision ID: 4e1a8b6c3d92
+Revises: 0c4d9e2f7a85
+Create Date: 2026-10-18 16:47:33.201964
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4e1a8b6c3d92'
+down_revision = '0c4d9e2f7a85'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('system_inventory',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('system_id', sa.Integer(), nullable=False),
+    sa.Column('job_id', sa.Integer(), nullable=True),
+    sa.Column('os_name', sa.String(length=200), nullable=True),
+    sa.Column('manufacturer', sa.String(length=100), nullable=True),
+    sa.Column('model', sa.String(length=100), nullable=True),
+    sa.Column('ram_gb', sa.Numeric(precision=6, scale=1, asdecimal=False), nullable=True),
+    sa.Column('is_current', sa.Boolean(), nullable=False),
+    sa.Column('collected_at', sa.DateTime(), nullable=True),
+    sa.Column('confirmed_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['system_id'], ['system.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('system_inventory', schema=None) as batch_op:
+        batch_op.create_index('ix_system_inventory_current_ram', ['is_current', 'ram_gb'], unique=False)
+        batch_op.create_index('ix_system_inventory_system_current', ['system_id', 'is_current'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('system_inventory', schema=None) as batch_op:
+        batch_op.drop_index('ix_system_inventory_system_current')
+        batch_op.drop_index('ix_system_inventory_current_ram')
+
+    op.drop_table('system_inventory')
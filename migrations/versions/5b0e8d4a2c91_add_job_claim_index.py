@@ -0,0 +1,26 @@
+"""Add composite index for job claiming
+
+Revision ID: 5b0e8d4a2c91
+Revises: 3f9a1c2e7b64
+Create Date: 2026-10-18 10:05:12.604917
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5b0e8d4a2c91'
+down_revision = '3f9a1c2e7b64'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('job', schema=None) as batch_op:
+        batch_op.create_index('ix_job_system_status_created', ['system_id', 'status', 'created_at'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('job', schema=None) as batch_op:
+        batch_op.drop_index('ix_job_system_status_created')
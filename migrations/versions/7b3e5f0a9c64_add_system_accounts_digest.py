@@ -0,0 +1,28 @@
+"""Add accounts digest columns to system
+
+Revision ID: 7b3e5f0a9c64
+Revises: 4e1a8b6c3d92
+Create Date: 2026-10-18 17:25:08.417352
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7b3e5f0a9c64'
+down_revision = '4e1a8b6c3d92'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('system', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('accounts_digest', sa.String(length=64), nullable=True))
+        batch_op.add_column(sa.Column('accounts_synced_at', sa.DateTime(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('system', schema=None) as batch_op:
+        batch_op.drop_column('accounts_synced_at')
+        batch_op.drop_column('accounts_digest')
@@ -0,0 +1,86 @@
+"""Move job output to compressed chunk table
+
+Revision ID: 9d2c6e1f4a38
+Revises: 5b0e8d4a2c91
+Create Date: 2026-10-18 11:20:03.771542
+
+"""
+import zlib
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9d2c6e1f4a38'
+down_revision = '5b0e8d4a2c91'
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 500
+
+
+def upgrade():
+    op.create_table('job_output_chunk',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('job_id', sa.Integer(), nullable=False),
+    sa.Column('offset', sa.Integer(), nullable=False),
+    sa.Column('length', sa.Integer(), nullable=False),
+    sa.Column('data', sa.LargeBinary(length=2**24 - 1), nullable=False),
+    sa.ForeignKeyConstraint(['job_id'], ['job.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('job_output_chunk', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_job_output_chunk_job_id'), ['job_id'], unique=False)
+
+    with op.batch_alter_table('job', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('output_size', sa.Integer(), nullable=False, server_default='0'))
+        batch_op.add_column(sa.Column('output_stored_bytes', sa.Integer(), nullable=False, server_default='0'))
+
+    # 分批把旧的 job.output 压缩后搬到 job_output_chunk
+    conn = op.get_bind()
+    job = sa.table('job', sa.column('id', sa.Integer), sa.column('output', sa.Text),
+                   sa.column('output_size', sa.Integer), sa.column('output_stored_bytes', sa.Integer))
+    chunk = sa.table('job_output_chunk', sa.column('job_id', sa.Integer), sa.column('offset', sa.Integer),
+                     sa.column('length', sa.Integer), sa.column('data', sa.LargeBinary))
+    last_id = 0
+    while True:
+        rows = conn.execute(sa.select(job.c.id, job.c.output)
+                            .where(job.c.id > last_id, job.c.output.isnot(None), job.c.output != '')
+                            .order_by(job.c.id).limit(BATCH_SIZE)).fetchall()
+        if not rows:
+            break
+        for job_id, output in rows:
+            data = zlib.compress(output.encode('utf-8'), 6)
+            conn.execute(chunk.insert().values(job_id=job_id, offset=0, length=len(output), data=data))
+            conn.execute(job.update().where(job.c.id == job_id)
+                         .values(output_size=len(output), output_stored_bytes=len(data)))
+        last_id = rows[-1][0]
+
+    with op.batch_alter_table('job', schema=None) as batch_op:
+        batch_op.drop_column('output')
+
+
+def downgrade():
+    with op.batch_alter_table('job', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('output', sa.Text(), nullable=True))
+
+    conn = op.get_bind()
+    job = sa.table('job', sa.column('id', sa.Integer), sa.column('output', sa.Text))
+    chunk = sa.table('job_output_chunk', sa.column('job_id', sa.Integer), sa.column('offset', sa.Integer),
+                     sa.column('data', sa.LargeBinary))
+    outputs = {}
+    for job_id, data in conn.execute(sa.select(chunk.c.job_id, chunk.c.data)
+                                     .order_by(chunk.c.job_id, chunk.c.offset)):
+        outputs.setdefault(job_id, []).append(zlib.decompress(data).decode('utf-8'))
+    for job_id, parts in outputs.items():
+        conn.execute(job.update().where(job.c.id == job_id).values(output=''.join(parts)))
+
+    with op.batch_alter_table('job', schema=None) as batch_op:
+        batch_op.drop_column('output_stored_bytes')
+        batch_op.drop_column('output_size')
+
+    with op.batch_alter_table('job_output_chunk', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_job_output_chunk_job_id'))
+
+    op.drop_table('job_output_chunk')
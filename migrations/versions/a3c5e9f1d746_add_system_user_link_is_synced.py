@@ -0,0 +1,27 @@
+"""Add system_user_link.is_synced (links confirmed as local accounts by agent sync)
+
+Revision ID: a3c5e9f1d746
+Revises: f4a1c7e3b2d8
+Create Date: 2026-10-18 22:05:18.664032
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a3c5e9f1d746'
+down_revision = 'f4a1c7e3b2d8'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # 已有链接无法区分来源，一律视为管理员维护；下次同步时出现在上报列表中的会被标记
+    with op.batch_alter_table('system_user_link', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('is_synced', sa.Boolean(), nullable=False, server_default='0'))
+
+
+def downgrade():
+    with op.batch_alter_table('system_user_link', schema=None) as batch_op:
+        batch_op.drop_column('is_synced')
@@ -0,0 +1,26 @@
+"""Add (system_id, id) index on job for latest-job lookups
+
+Revision ID: a41f7c3b9e05
+Revises: 9d2c6e1f4a38
+Create Date: 2026-10-18 11:48:27.093311
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a41f7c3b9e05'
+down_revision = '9d2c6e1f4a38'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('job', schema=None) as batch_op:
+        batch_op.create_index('ix_job_system_id_id', ['system_id', 'id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('job', schema=None) as batch_op:
+        batch_op.drop_index('ix_job_system_id_id')
@@ -0,0 +1,38 @@
+"""Add system.last_seen_at, job.attempts and running-job index
+
+Revision ID: a9f6c2d4e813
+Revises: 7b3e5f0a9c64
+Create Date: 2026-10-18 18:04:51.660297
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a9f6c2d4e813'
+down_revision = '7b3e5f0a9c64'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('system', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('last_seen_at', sa.DateTime(), nullable=True))
+
+    with op.batch_alter_table('job', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('attempts', sa.Integer(), nullable=False, server_default='0'))
+        batch_op.create_index('ix_job_status_started', ['status', 'started_at'], unique=False)
+
+    # 已经开始过的任务至少被领取过一次
+    job = sa.table('job', sa.column('attempts', sa.Integer), sa.column('started_at', sa.DateTime))
+    op.execute(job.update().where(job.c.started_at.isnot(None)).values(attempts=1))
+
+
+def downgrade():
+    with op.batch_alter_table('job', schema=None) as batch_op:
+        batch_op.drop_index('ix_job_status_started')
+        batch_op.drop_column('attempts')
+
+    with op.batch_alter_table('system', schema=None) as batch_op:
+        batch_op.drop_column('last_seen_at')
@@ -0,0 +1,60 @@
+"""Add pending_systems.hostname_key / matched system and index system.ip_address
+
+Revision ID: b5d1e7a3c620
+Revises: a9f6c2d4e813
+Create Date: 2026-10-18 18:42:17.305518
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b5d1e7a3c620'
+down_revision = 'a9f6c2d4e813'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('pending_systems', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('hostname_key', sa.String(length=100), nullable=True))
+        batch_op.add_column(sa.Column('matched_system_id', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('match_reason', sa.String(length=20), nullable=True))
+        batch_op.create_foreign_key('fk_pending_systems_matched_system_id', 'system', ['matched_system_id'], ['id'])
+
+    # 回填规范化的计算机名；规范化后重复的记录只保留最近上报的一条
+    bind = op.get_bind()
+    pending = sa.table('pending_systems', sa.column('id', sa.Integer), sa.column('computer_name', sa.String),
+                       sa.column('first_seen', sa.DateTime), sa.column('hostname_key', sa.String))
+    rows = bind.execute(sa.select(pending.c.id, pending.c.computer_name)
+                        .order_by(pending.c.first_seen.desc(), pending.c.id.desc())).fetchall()
+    seen, duplicates = set(), []
+    for row_id, computer_name in rows:
+        key = (computer_name or '').strip().rstrip('.').lower() or None
+        if key is None or key in seen:
+            if key is not None:
+                duplicates.append(row_id)
+            continue
+        seen.add(key)
+        bind.execute(pending.update().where(pending.c.id == row_id).values(hostname_key=key))
+    if duplicates:
+        bind.execute(pending.delete().where(pending.c.id.in_(duplicates)))
+
+    with op.batch_alter_table('pending_systems', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_pending_systems_hostname_key'), ['hostname_key'], unique=True)
+
+    with op.batch_alter_table('system', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_system_ip_address'), ['ip_address'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('system', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_system_ip_address'))
+
+    with op.batch_alter_table('pending_systems', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_pending_systems_hostname_key'))
+        batch_op.drop_constraint('fk_pending_systems_matched_system_id', type_='foreignkey')
+        batch_op.drop_column('match_reason')
+        batch_op.drop_column('matched_system_id')
+        batch_op.drop_column('hostname_key')
@@ -0,0 +1,29 @@
+"""Store system_inventory.ram_gb as NUMERIC(6,1) instead of single-precision FLOAT
+
+Revision ID: b8d2f6a4c157
+Revises: a3c5e9f1d746
+Create Date: 2026-10-18 22:31:40.275190
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b8d2f6a4c157'
+down_revision = 'a3c5e9f1d746'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # 已按旧版 4e1a8b6c3d92 建表 (FLOAT) 的数据库在这里转换；新建的数据库已是 NUMERIC，转换无副作用
+    with op.batch_alter_table('system_inventory', schema=None) as batch_op:
+        batch_op.alter_column('ram_gb', existing_type=sa.Float(),
+                              type_=sa.Numeric(precision=6, scale=1, asdecimal=False), existing_nullable=True)
+
+
+def downgrade():
+    with op.batch_alter_table('system_inventory', schema=None) as batch_op:
+        batch_op.alter_column('ram_gb', existing_type=sa.Numeric(precision=6, scale=1, asdecimal=False),
+                              type_=sa.Float(), existing_nullable=True)
@@ -0,0 +1,26 @@
+"""Add system.last_admin_activity_at
+
+Revision ID: c3f8a2e6d915
+Revises: b5d1e7a3c620
+Create Date: 2026-10-18 19:21:06.482913
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c3f8a2e6d915'
+down_revision = 'b5d1e7a3c620'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('system', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('last_admin_activity_at', sa.DateTime(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('system', schema=None) as batch_op:
+        batch_op.drop_column('last_admin_activity_at')
@@ -0,0 +1,53 @@
+"""Add script content hash and script_version table
+
+Revision ID: c6e2b8f0d713
+Revises: a41f7c3b9e05
+Create Date: 2026-10-18 13:02:55.410928
+
+"""
+import hashlib
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c6e2b8f0d713'
+down_revision = 'a41f7c3b9e05'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('script_version',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('content_hash', sa.String(length=64), nullable=False),
+    sa.Column('content', sa.Text(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('script_version', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_script_version_content_hash'), ['content_hash'], unique=True)
+
+    with op.batch_alter_table('script', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('content_hash', sa.String(length=64), nullable=True))
+        batch_op.create_index(batch_op.f('ix_script_content_hash'), ['content_hash'], unique=False)
+
+    # 回填哈希，算法与 app.models.script_content_hash 一致
+    conn = op.get_bind()
+    script = sa.table('script', sa.column('id', sa.Integer), sa.column('content', sa.Text),
+                      sa.column('content_hash', sa.String))
+    for script_id, content in conn.execute(sa.select(script.c.id, script.c.content)).fetchall():
+        content_hash = hashlib.sha256((content or '').encode('utf-8')).hexdigest()
+        conn.execute(script.update().where(script.c.id == script_id).values(content_hash=content_hash))
+
+
+def downgrade():
+    with op.batch_alter_table('script', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_script_content_hash'))
+        batch_op.drop_column('content_hash')
+
+    with op.batch_alter_table('script_version', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_script_version_content_hash'))
+
+    op.drop_table('script_version')
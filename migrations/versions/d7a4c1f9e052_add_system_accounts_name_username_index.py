@@ -0,0 +1,26 @@
+"""Add (chinese_name, username) index on system_accounts for directory paging
+
+Revision ID: d7a4c1f9e052
+Revises: c3f8a2e6d915
+Create Date: 2026-10-18 19:58:33.170248
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd7a4c1f9e052'
+down_revision = 'c3f8a2e6d915'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('system_accounts', schema=None) as batch_op:
+        batch_op.create_index('ix_system_accounts_name_username', ['chinese_name', 'username'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('system_accounts', schema=None) as batch_op:
+        batch_op.drop_index('ix_system_accounts_name_username')
@@ -0,0 +1,47 @@
+"""Add system_accounts.name_pinyin / name_initials
+
+Revision ID: e5b9d3a7f218
+Revises: d7a4c1f9e052
+Create Date: 2026-10-18 20:37:12.904551
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5b9d3a7f218'
+down_revision = 'd7a4c1f9e052'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('system_accounts', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('name_pinyin', sa.String(length=255), nullable=True))
+        batch_op.add_column(sa.Column('name_initials', sa.String(length=64), nullable=True))
+
+    # 回填拼音；未安装 pypinyin 时跳过，安装后执行 flask refresh-account-pinyin
+    try:
+        from app.account_search import PINYIN_AVAILABLE, pinyin_fields
+    except ImportError:
+        return
+    if not PINYIN_AVAILABLE:
+        return
+    bind = op.get_bind()
+    accounts = sa.table('system_accounts', sa.column('id', sa.Integer), sa.column('chinese_name', sa.String),
+                        sa.column('name_pinyin', sa.String), sa.column('name_initials', sa.String))
+    rows = bind.execute(sa.select(accounts.c.id, accounts.c.chinese_name)).fetchall()
+    values = [{'b_id': account_id, 'b_pinyin': full, 'b_initials': initials}
+              for account_id, chinese_name in rows
+              for full, initials in [pinyin_fields(chinese_name)]]
+    if values:
+        bind.execute(accounts.update().where(accounts.c.id == sa.bindparam('b_id'))
+                     .values(name_pinyin=sa.bindparam('b_pinyin'), name_initials=sa.bindparam('b_initials')),
+                     values)
+
+
+def downgrade():
+    with op.batch_alter_table('system_accounts', schema=None) as batch_op:
+        batch_op.drop_column('name_initials')
+        batch_op.drop_column('name_pinyin')
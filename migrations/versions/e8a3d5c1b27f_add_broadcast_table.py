@@ -0,0 +1,44 @@
+"""Add broadcast table and job.broadcast_id
+
+Revision ID: e8a3d5c1b27f
+Revises: c6e2b8f0d713
+Create Date: 2026-10-18 14:21:06.528117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e8a3d5c1b27f'
+down_revision = 'c6e2b8f0d713'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('broadcast',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('script_id', sa.Integer(), nullable=False),
+    sa.Column('requested_by_id', sa.Integer(), nullable=False),
+    sa.Column('group_id', sa.Integer(), nullable=True),
+    sa.Column('target_count', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['group_id'], ['group.id'], ),
+    sa.ForeignKeyConstraint(['requested_by_id'], ['platform_users.id'], ),
+    sa.ForeignKeyConstraint(['script_id'], ['script.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('job', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('broadcast_id', sa.Integer(), nullable=True))
+        batch_op.create_foreign_key('fk_job_broadcast_id', 'broadcast', ['broadcast_id'], ['id'])
+        batch_op.create_index('ix_job_broadcast_status', ['broadcast_id', 'status'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('job', schema=None) as batch_op:
+        batch_op.drop_index('ix_job_broadcast_status')
+        batch_op.drop_constraint('fk_job_broadcast_id', type_='foreignkey')
+        batch_op.drop_column('broadcast_id')
+
+    op.drop_table('broadcast')
@@ -0,0 +1,68 @@
+"""Add job_schedule, scheduler_lease and job.not_before
+
+Revision ID: f2b7c4e9a160
+Revises: e8a3d5c1b27f
+Create Date: 2026-10-18 15:10:42.733015
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f2b7c4e9a160'
+down_revision = 'e8a3d5c1b27f'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('job_schedule',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=100), nullable=False),
+    sa.Column('script_id', sa.Integer(), nullable=False),
+    sa.Column('group_id', sa.Integer(), nullable=True),
+    sa.Column('system_ids', sa.Text(), nullable=True),
+    sa.Column('cron', sa.String(length=100), nullable=False),
+    sa.Column('jitter_seconds', sa.Integer(), nullable=False),
+    sa.Column('is_enabled', sa.Boolean(), nullable=False),
+    sa.Column('next_run_at', sa.DateTime(), nullable=True),
+    sa.Column('last_run_at', sa.DateTime(), nullable=True),
+    sa.Column('created_by_id', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['created_by_id'], ['platform_users.id'], ),
+    sa.ForeignKeyConstraint(['group_id'], ['group.id'], ),
+    sa.ForeignKeyConstraint(['script_id'], ['script.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('job_schedule', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_job_schedule_next_run_at'), ['next_run_at'], unique=False)
+
+    op.create_table('scheduler_lease',
+    sa.Column('name', sa.String(length=50), nullable=False),
+    sa.Column('holder', sa.String(length=100), nullable=False),
+    sa.Column('expires_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('name')
+    )
+
+    with op.batch_alter_table('broadcast', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('schedule_id', sa.Integer(), nullable=True))
+        batch_op.create_foreign_key('fk_broadcast_schedule_id', 'job_schedule', ['schedule_id'], ['id'])
+
+    with op.batch_alter_table('job', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('not_before', sa.DateTime(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('job', schema=None) as batch_op:
+        batch_op.drop_column('not_before')
+
+    with op.batch_alter_table('broadcast', schema=None) as batch_op:
+        batch_op.drop_constraint('fk_broadcast_schedule_id', type_='foreignkey')
+        batch_op.drop_column('schedule_id')
+
+    op.drop_table('scheduler_lease')
+    with op.batch_alter_table('job_schedule', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_job_schedule_next_run_at'))
+
+    op.drop_table('job_schedule')
@@ -0,0 +1,79 @@
+"""Add access_matrix table (person x system access, denormalized)
+
+Revision ID: f4a1c7e3b2d8
+Revises: e5b9d3a7f218
+Create Date: 2026-10-18 21:14:46.381927
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f4a1c7e3b2d8'
+down_revision = 'e5b9d3a7f218'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('access_matrix',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('link_type', sa.String(length=16), nullable=False),
+    sa.Column('link_id', sa.Integer(), nullable=False),
+    sa.Column('account_id', sa.Integer(), nullable=False),
+    sa.Column('chinese_name', sa.String(length=64), nullable=False),
+    sa.Column('username', sa.String(length=64), nullable=False),
+    sa.Column('system_id', sa.Integer(), nullable=False),
+    sa.Column('system_number', sa.String(length=50), nullable=False),
+    sa.Column('system_name', sa.String(length=150), nullable=False),
+    sa.Column('group_id', sa.Integer(), nullable=True),
+    sa.Column('role', sa.String(length=64), nullable=True),
+    sa.Column('is_active', sa.Boolean(), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('link_type', 'link_id', name='uq_access_matrix_link')
+    )
+    with op.batch_alter_table('access_matrix', schema=None) as batch_op:
+        batch_op.create_index('ix_access_matrix_active_name', ['is_active', 'chinese_name', 'username'], unique=False)
+        batch_op.create_index('ix_access_matrix_name', ['chinese_name'], unique=False)
+        batch_op.create_index('ix_access_matrix_account', ['account_id'], unique=False)
+        batch_op.create_index('ix_access_matrix_system', ['system_id', 'link_type'], unique=False)
+        batch_op.create_index('ix_access_matrix_group', ['group_id'], unique=False)
+
+    # 用现有链接回填矩阵 (用表达式生成 SQL，MySQL 8 中 system 是保留字，需要引号)
+    matrix = sa.table('access_matrix', *[sa.column(name) for name in (
+        'link_type', 'link_id', 'account_id', 'chinese_name', 'username', 'system_id',
+        'system_number', 'system_name', 'group_id', 'role', 'is_active')])
+    accounts = sa.table('system_accounts', sa.column('id'), sa.column('chinese_name'), sa.column('username'))
+    systems = sa.table('system', sa.column('id'), sa.column('system_number'), sa.column('name'), sa.column('group_id'))
+    roles = sa.table('system_role', sa.column('id'), sa.column('name'))
+    computer = sa.table('system_user_link', sa.column('id'), sa.column('account_id'), sa.column('system_id'),
+                        sa.column('system_role'), sa.column('is_active'))
+    workstation = sa.table('workstation_user_link', sa.column('id'), sa.column('account_id'), sa.column('system_id'),
+                           sa.column('role_id'), sa.column('is_active'))
+    op.execute(matrix.insert().from_select(
+        [c.name for c in matrix.c],
+        sa.select(sa.literal('computer'), computer.c.id, computer.c.account_id, accounts.c.chinese_name,
+                  accounts.c.username, computer.c.system_id, systems.c.system_number, systems.c.name,
+                  systems.c.group_id, computer.c.system_role, computer.c.is_active)
+        .select_from(computer.join(accounts, accounts.c.id == computer.c.account_id)
+                     .join(systems, systems.c.id == computer.c.system_id))))
+    op.execute(matrix.insert().from_select(
+        [c.name for c in matrix.c],
+        sa.select(sa.literal('workstation'), workstation.c.id, workstation.c.account_id, accounts.c.chinese_name,
+                  accounts.c.username, workstation.c.system_id, systems.c.system_number, systems.c.name,
+                  systems.c.group_id, roles.c.name, workstation.c.is_active)
+        .select_from(workstation.join(accounts, accounts.c.id == workstation.c.account_id)
+                     .join(systems, systems.c.id == workstation.c.system_id)
+                     .join(roles, roles.c.id == workstation.c.role_id))))
+
+
+def downgrade():
+    with op.batch_alter_table('access_matrix', schema=None) as batch_op:
+        batch_op.drop_index('ix_access_matrix_group')
+        batch_op.drop_index('ix_access_matrix_system')
+        batch_op.drop_index('ix_access_matrix_account')
+        batch_op.drop_index('ix_access_matrix_name')
+        batch_op.drop_index('ix_access_matrix_active_name')
+
+    op.drop_table('access_matrix')